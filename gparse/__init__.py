@@ -10,9 +10,19 @@ Copyright Sean McGrath 2015. Issued under the MIT License.
 from .spectrum import Spectrum, PeakAssigner, PeakReporter
 from .matrix import DistanceMatrix
 from .configuration import Configuration
+from .collection import SpectrumCollection
+from .trajectory import Trajectory
 
 __title__ = 'raman'
 __version__ = '0.0.1'
 __author__ = 'Sean McGrath'
 __license__ = 'MIT'
 __copyright__ = 'Copyright 2015 Sean McGrath'
+
+
+def __getattr__(name):
+    # The ensemble module loads multiprocessing, so only import it when used
+    if name in ('EnsembleStore', 'EnsembleView'):
+        from . import ensemble
+        return getattr(ensemble, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,11 @@
+"""
+Allows the gparse command to be run as python -m gparse.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
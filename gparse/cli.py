@@ -0,0 +1,383 @@
+"""
+Command line entry point for batch extraction of data from
+Gaussian .log and .fchk files.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from .spectrum import Spectrum, PeakAssigner
+from .matrix import DistanceMatrix
+from . import fchk
+from .logfile import open_log
+
+
+EXTRACTABLE = ('raman', 'ir', 'matrix', 'assignments')
+FORMATS = ('jsonl', 'csv', 'binary')
+
+# Maximum number of unfinished files per worker; bounds memory use
+# when thousands of inputs are queued.
+FILES_IN_FLIGHT_PER_WORKER = 4
+
+
+def is_fchk(filename):
+    """
+    Whether a file is a formatted checkpoint, e.g. job.fchk or job.fchk.gz,
+    rather than a .log file.
+    """
+
+    return '.fchk' in os.path.basename(filename)
+
+
+def extract(filename, kinds=EXTRACTABLE, width=Spectrum.LORENTZIAN_WIDTH):
+    """
+    Extract data from one Gaussian .log or .fchk file into a plain dict.
+    Failures are reported rather than raised, so one bad file does not
+    stop a batch: a kind of data that cannot be extracted, e.g. raman
+    from a job run without raman, is reported in the 'errors' entry, a dict
+    of kind to message, and the other kinds are still extracted. If the
+    file cannot be read, or nothing can be extracted from it, the 'error'
+    entry reports why.
+    :param filename: path to the .log or .fchk file.
+    :param kinds: the data to extract, any of EXTRACTABLE.
+    :param width: lorentzian width to record for extracted spectra.
+    """
+
+    record = {'source': filename}
+    try:
+        if is_fchk(filename):
+            values = fchk.read_fchk(filename, fchk.SPECTRUM_LABELS + fchk.MATRIX_LABELS
+                                    + fchk.MODE_LABELS)
+            read_spectrum = lambda kind: Spectrum.from_fchk_values(values, kind, width)
+            read_matrix = lambda: DistanceMatrix(fchk.distance_matrix(values))
+            read_assigner = lambda: PeakAssigner.from_fchk_values(values)
+        else:
+            with open_log(filename) as open_file:
+                lines = open_file.readlines()
+            read_spectrum = lambda kind: Spectrum.from_log_lines(lines, kind, width)
+            read_matrix = lambda: DistanceMatrix.from_log_lines(lines)
+            read_assigner = lambda: PeakAssigner.from_log_lines(lines)
+    except Exception as error:
+        record['error'] = _describe(error)
+        return record
+
+    def read_spectrum_record(kind):
+        spectrum = read_spectrum(kind)
+        return {'frequencies': spectrum.frequencies,
+                'intensities': spectrum.intensities,
+                'width': spectrum.lorentzian_width}
+
+    def read_assignments():
+        return [{'number': peak.number,
+                 'frequency': peak.frequency,
+                 'atoms': [{'number': atom.number,
+                            'element': atom.element,
+                            'eigen_sum': atom.eigen_sum}
+                           for atom in peak.assign()]}
+                for peak in read_assigner().peaks]
+
+    readers = {'raman': lambda: read_spectrum_record('raman'),
+               'ir': lambda: read_spectrum_record('ir'),
+               'matrix': lambda: [list(row) for row in read_matrix()],
+               'assignments': read_assignments}
+
+    errors = {}
+    for kind in EXTRACTABLE:
+        if kind in kinds:
+            try:
+                record[kind] = readers[kind]()
+            except Exception as error:
+                errors[kind] = _describe(error)
+
+    if errors:
+        record['errors'] = errors
+    if not any(record.get(kind) for kind in EXTRACTABLE):
+        record['error'] = 'Nothing could be extracted' + ''.join(
+            '; {} ({})'.format(kind, message) for kind, message in errors.items())
+
+    return record
+
+
+def _describe(error):
+    return '{}: {}'.format(type(error).__name__, error)
+
+
+def csv_rows(record):
+    """
+    Flatten a record from extract() into (source, kind, index, x, y) rows.
+    Spectra give (mode, frequency, intensity), matrices give (row, column,
+    distance) and assignments give (peak, atom, eigen_sum).
+    """
+
+    source = record['source']
+    if 'error' in record:
+        yield (source, 'error', '', '', record['error'])
+        return
+    for kind, message in record.get('errors', {}).items():
+        yield (source, 'error', kind, '', message)
+
+    for kind in ('raman', 'ir'):
+        if kind in record:
+            spectrum = record[kind]
+            for i, (frequency, intensity) in enumerate(
+                    zip(spectrum['frequencies'], spectrum['intensities'])):
+                yield (source, kind, i + 1, frequency, intensity)
+
+    for i, row in enumerate(record.get('matrix', ())):
+        for j, distance in enumerate(row):
+            yield (source, 'matrix', i + 1, j + 1, distance)
+
+    for peak in record.get('assignments', ()):
+        for atom in peak['atoms']:
+            yield (source, 'assignment', peak['number'], atom['number'], atom['eigen_sum'])
+
+
+class RecordWriter:
+    """
+    Streams records from extract() to an output file in one of FORMATS.
+
+    jsonl writes one JSON object per line, csv writes the rows given by
+    csv_rows, and binary writes one pickled record after another.
+    """
+
+    CSV_HEADER = ('source', 'kind', 'index', 'x', 'y')
+
+    def __init__(self, path=None, output_format='jsonl', append=False):
+        """
+        Constructor.
+        :param path: output file path, or None for standard output.
+        :param output_format: one of FORMATS.
+        :param append: add to an existing output rather than replacing it.
+        """
+
+        if output_format not in FORMATS:
+            raise ValueError('Output format must be one of ' + str(FORMATS))
+        self.format = output_format
+
+        binary = output_format == 'binary'
+        if path is None:
+            self._file = sys.stdout.buffer if binary else sys.stdout
+            self._owns_file = False
+            is_new = True
+        else:
+            is_new = not (append and os.path.exists(path) and os.path.getsize(path))
+            mode = ('a' if append else 'w') + ('b' if binary else '')
+            self._file = open(path, mode) if binary else open(path, mode, newline='')
+            self._owns_file = True
+
+        if output_format == 'jsonl':
+            import json
+            self._dumps = json.dumps
+        elif output_format == 'csv':
+            import csv
+            self._csv = csv.writer(self._file)
+            if is_new:
+                self._csv.writerow(self.CSV_HEADER)
+        else:
+            import pickle
+            self._pickler = pickle.Pickler(self._file, pickle.HIGHEST_PROTOCOL)
+
+    def write(self, record):
+        if self.format == 'jsonl':
+            self._file.write(self._dumps(record) + '\n')
+        elif self.format == 'csv':
+            self._csv.writerows(csv_rows(record))
+        else:
+            self._pickler.dump(record)
+            # Records are independent; don't let the memo grow without bound.
+            self._pickler.clear_memo()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_journal(path):
+    """
+    Read the set of inputs recorded as complete in a journal file.
+    """
+
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as journal:
+        return set(line.rstrip('\n') for line in journal if line.strip())
+
+
+def input_files(paths, stdin=None):
+    """
+    Lazily generate input file names from the command line, reading names
+    one per line from stdin when no paths (or '-') are given.
+    """
+
+    stdin = stdin or sys.stdin
+    for path in paths or ['-']:
+        if path == '-':
+            for line in stdin:
+                line = line.strip()
+                if line:
+                    yield line
+        else:
+            yield path
+
+
+def extract_all(filenames, kinds=EXTRACTABLE, workers=1, width=Spectrum.LORENTZIAN_WIDTH):
+    """
+    Generate extract() records for each file, in completion order.
+    With more than one worker files are processed in a process pool,
+    keeping only a bounded number of unfinished files in flight.
+    """
+
+    if workers <= 1:
+        for filename in filenames:
+            yield extract(filename, kinds, width)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    max_in_flight = workers * FILES_IN_FLIGHT_PER_WORKER
+    with ProcessPoolExecutor(workers) as executor:
+        pending = set()
+        for filename in filenames:
+            pending.add(executor.submit(extract, filename, kinds, width))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+class Progress:
+    """
+    Reports the number of files processed to a stream, at most
+    once per interval seconds.
+    """
+
+    def __init__(self, stream=None, interval=0.5):
+        self.stream = stream or sys.stderr
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0
+        self._start = self._last = time.time()
+
+    def update(self, record):
+        self.done += 1
+        if 'error' in record:
+            self.failed += 1
+        now = time.time()
+        if now - self._last >= self.interval:
+            self._last = now
+            self.report(end='\r')
+
+    def report(self, end='\n'):
+        elapsed = max(time.time() - self._start, 1e-9)
+        self.stream.write('{} files processed, {} failed, {} skipped ({:.1f} files/s){}'.format(
+            self.done, self.failed, self.skipped, self.done / elapsed, end))
+        self.stream.flush()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='gparse',
+        description='Extract spectra, distance matrices and peak assignments '
+                    'from Gaussian .log and .fchk files.')
+    parser.add_argument('inputs', nargs='*',
+                        help="Gaussian .log or .fchk files. With none, or '-', file "
+                             "names are read from stdin one per line.")
+    parser.add_argument('-o', '--output',
+                        help='output file (default: standard output).')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='jsonl',
+                        help='output format (default: jsonl).')
+    parser.add_argument('-e', '--extract', default=','.join(EXTRACTABLE),
+                        help='comma separated data to extract, any of ' +
+                             ', '.join(EXTRACTABLE) + ' (default: all).')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of worker processes (default: 1).')
+    parser.add_argument('-w', '--width', type=float, default=Spectrum.LORENTZIAN_WIDTH,
+                        help='lorentzian width to record for spectra.')
+    parser.add_argument('--resume', action='store_true',
+                        help='skip inputs recorded in the journal, including '
+                             'failed ones, and append to the output. '
+                             'Requires --output.')
+    parser.add_argument('--journal',
+                        help='file recording completed inputs '
+                             '(default: OUTPUT.done when --resume is given).')
+    parser.add_argument('-p', '--progress', action='store_true',
+                        help='report progress on stderr.')
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the gparse command. Returns the process exit status:
+    0 on success, 1 if any input failed.
+    """
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    kinds = tuple(kind.strip() for kind in args.extract.split(',') if kind.strip())
+    for kind in kinds:
+        if kind not in EXTRACTABLE:
+            parser.error('cannot extract {!r}; choose from {}'.format(
+                kind, ', '.join(EXTRACTABLE)))
+    if args.resume and not args.output:
+        parser.error('--resume requires --output')
+
+    journal_path = args.journal
+    if journal_path is None and args.resume:
+        journal_path = args.output + '.done'
+    completed = read_journal(journal_path) if args.resume else set()
+
+    progress = Progress() if args.progress else None
+
+    def pending_files():
+        for filename in input_files(args.inputs):
+            if filename in completed:
+                if progress:
+                    progress.skipped += 1
+                continue
+            yield filename
+
+    failed = 0
+    journal = open(journal_path, 'a' if args.resume else 'w') if journal_path else None
+    try:
+        with RecordWriter(args.output, args.format, append=args.resume) as writer:
+            for record in extract_all(pending_files(), kinds, args.workers, args.width):
+                writer.write(record)
+                if 'error' in record:
+                    failed += 1
+                if journal:
+                    # Only journal a file once its record has reached the output.
+                    # Failures are journaled too, so resuming doesn't repeat them.
+                    writer.flush()
+                    journal.write(record['source'] + '\n')
+                    journal.flush()
+                if progress:
+                    progress.update(record)
+    finally:
+        if journal:
+            journal.close()
+        if progress:
+            progress.report()
+
+    return 1 if failed else 0
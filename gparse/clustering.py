@@ -0,0 +1,342 @@
+"""
+Defines tools for clustering ensembles of Configurations by the root
+mean square deviation of their distance matrices.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+from bisect import bisect_left, bisect_right, insort
+
+from .matrix import DistanceMatrix
+from .spectrum import Spectrum, spectrum_attribute
+from .util import rms_deviation
+
+
+class Clustering:
+    """
+    The outcome of clustering Configurations: the cluster of every
+    Configuration and a representative Configuration of each cluster.
+    """
+
+    def __init__(self, configurations, labels, representatives, evaluations):
+        """
+        Constructor.
+        :param configurations: the clustered Configurations.
+        :param labels: the cluster index of each Configuration.
+        :param representatives: the index of the representative
+        Configuration of each cluster.
+        :param evaluations: the number of distinct RMS deviations calculated.
+        """
+
+        self.configurations = configurations
+        self.labels = labels
+        self.representatives = representatives
+        self.evaluations = evaluations
+
+    def __len__(self):
+        return len(self.representatives)
+
+    def __repr__(self):
+        return 'Clustering of {} configurations into {} clusters'.format(
+            len(self.configurations), len(self))
+
+    @property
+    def clusters(self):
+        """
+        The indices of the Configurations in each cluster.
+        """
+
+        members = [[] for _ in self.representatives]
+        for index, label in enumerate(self.labels):
+            members[label].append(index)
+        return members
+
+    @property
+    def representative_configurations(self):
+        """
+        The representative Configuration of each cluster.
+        """
+
+        return [self.configurations[index] for index in self.representatives]
+
+    def average_spectrum(self, cluster, type='raman'):
+        """
+        Average the spectra of the Configurations in a cluster.
+        :param cluster: index of the cluster.
+        :param type: 'raman' or 'ir'.
+        :returns: a Spectrum holding the peaks of every member with their
+        intensities divided by the number of members, whose fit is the
+        average of the members' fits. It has the width of the
+        representative's spectrum.
+        """
+
+        attribute = spectrum_attribute(type)
+
+        members = self.clusters[cluster]
+        frequencies, intensities = [], []
+        for index in members:
+            spectrum = getattr(self.configurations[index], attribute)
+            if spectrum is None:
+                raise ValueError('Every Configuration must have a {}.'.format(attribute))
+            frequencies.extend(spectrum.frequencies)
+            intensities.extend(intensity / len(members) for intensity in spectrum.intensities)
+
+        width = getattr(self.configurations[self.representatives[cluster]], attribute).lorentzian_width
+        return Spectrum(frequencies, intensities, width)
+
+    def average_spectra(self, type='raman'):
+        """
+        Average the spectra of every cluster, in cluster order.
+        """
+
+        return [self.average_spectrum(cluster, type) for cluster in range(len(self))]
+
+
+class _Distances:
+    """
+    Calculates RMS deviations between the distance matrices of
+    Configurations on demand, caching each pair.
+    """
+
+    def __init__(self, configurations):
+        _, stride, _, values = DistanceMatrix.stack(
+            configuration.matrix for configuration in configurations)
+        self.vectors = [values[start:start + stride]
+                        for start in range(0, len(values), stride or 1)]
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def __call__(self, i, j):
+        if i == j:
+            return 0.0
+        key = (i, j) if i < j else (j, i)
+        distance = self.cache.get(key)
+        if distance is None:
+            distance = rms_deviation(self.vectors[i], self.vectors[j])
+            self.cache[key] = distance
+        return distance
+
+
+def _relabel(labels, representatives):
+    """
+    Number clusters in order of their first member, dropping empty clusters.
+    """
+
+    order = {}
+    for label in labels:
+        if label not in order:
+            order[label] = len(order)
+    new_representatives = [None] * len(order)
+    for label, new_label in order.items():
+        new_representatives[new_label] = representatives[label]
+    return [order[label] for label in labels], new_representatives
+
+
+def leader_clustering(configurations, threshold):
+    """
+    Cluster Configurations in a single pass: each joins the cluster of the
+    first earlier leader within threshold of it, or else leads a new cluster.
+
+    The RMS deviation is a metric, so by the triangle inequality a leader
+    can only be within threshold of a Configuration if their deviations
+    from a fixed pivot (the first Configuration) differ by at most
+    threshold. Leaders are kept sorted by deviation from the pivot so only
+    those need be compared.
+    :param configurations: a list of Configurations with the same atoms.
+    :param threshold: the largest RMS deviation from a leader.
+    :returns: a Clustering whose representatives are the leaders.
+    """
+
+    distances = _Distances(configurations)
+    if not len(distances):
+        return Clustering(configurations, [], [], 0)
+
+    leaders, labels = [], []
+    # (deviation from the pivot, cluster index) of each leader
+    keys = []
+    for i in range(len(distances)):
+        pivot_distance = distances(0, i)
+        low = bisect_left(keys, (pivot_distance - threshold, -1))
+        high = bisect_right(keys, (pivot_distance + threshold, len(leaders)))
+        for cluster in sorted(cluster for _, cluster in keys[low:high]):
+            if distances(leaders[cluster], i) <= threshold:
+                labels.append(cluster)
+                break
+        else:
+            labels.append(len(leaders))
+            insort(keys, (pivot_distance, len(leaders)))
+            leaders.append(i)
+
+    return Clustering(configurations, labels, leaders, len(distances.cache))
+
+
+def k_medoids(configurations, k, max_iterations=100):
+    """
+    Partition Configurations into k clusters, each represented by the
+    member with the least total RMS deviation from the others.
+
+    Medoids are seeded farthest-first, then assignment and medoid update
+    alternate until the medoids stop changing. During assignment a medoid
+    is skipped, by the triangle inequality, when it is at least twice as
+    far from the current best medoid as the Configuration is.
+    :param configurations: a list of Configurations with the same atoms.
+    :param k: the number of clusters.
+    :param max_iterations: the most assignment and update rounds to run.
+    :returns: a Clustering whose representatives are the medoids.
+    """
+
+    distances = _Distances(configurations)
+    count = len(distances)
+    if not 1 <= k <= count:
+        raise ValueError('k must be between 1 and the number of Configurations.')
+
+    # Farthest-first seeding
+    medoids = [0]
+    nearest = [distances(0, i) for i in range(count)]
+    while len(medoids) < k:
+        farthest = max(range(count), key=lambda i: nearest[i])
+        medoids.append(farthest)
+        nearest = [min(distance, distances(farthest, i)) for i, distance in enumerate(nearest)]
+
+    labels = [0] * count
+    for _ in range(max_iterations):
+        between = [[distances(a, b) for b in medoids] for a in medoids]
+        for i in range(count):
+            best = labels[i]
+            best_distance = distances(medoids[best], i)
+            for cluster, medoid in enumerate(medoids):
+                if cluster == best or between[best][cluster] >= 2 * best_distance:
+                    continue
+                distance = distances(medoid, i)
+                if distance < best_distance:
+                    best, best_distance = cluster, distance
+            labels[i] = best
+
+        members = [[] for _ in medoids]
+        for i, label in enumerate(labels):
+            members[label].append(i)
+        new_medoids = []
+        for medoid, cluster_members in zip(medoids, members):
+            best, best_total = medoid, None
+            for candidate in cluster_members:
+                total = sum(distances(candidate, other) for other in cluster_members)
+                if best_total is None or total < best_total:
+                    best, best_total = candidate, total
+            new_medoids.append(best)
+
+        if new_medoids == medoids:
+            break
+        medoids = new_medoids
+
+    labels, medoids = _relabel(labels, medoids)
+    return Clustering(configurations, labels, medoids, len(distances.cache))
+
+
+LINKAGES = {
+    'single': lambda d_a, d_b, size_a, size_b: min(d_a, d_b),
+    'complete': lambda d_a, d_b, size_a, size_b: max(d_a, d_b),
+    'average': lambda d_a, d_b, size_a, size_b: (size_a * d_a + size_b * d_b) / (size_a + size_b),
+}
+
+
+def hierarchical_clustering(configurations, threshold=None, clusters=None, linkage='average'):
+    """
+    Cluster Configurations agglomeratively, repeatedly merging the two
+    closest clusters, then cut the tree by distance or cluster count.
+
+    Merges are found with the nearest-neighbour chain algorithm in
+    O(N^2) time. Unlike leader_clustering and k_medoids, every pairwise
+    RMS deviation is needed.
+    :param configurations: a list of Configurations with the same atoms.
+    :param threshold: if given, only merge clusters closer than this.
+    :param clusters: if given instead, the number of clusters to form.
+    :param linkage: 'single', 'complete' or 'average': the distance between
+    clusters is the least, greatest or mean deviation between their members.
+    :returns: a Clustering whose representatives are the medoids.
+    """
+
+    if (threshold is None) == (clusters is None):
+        raise ValueError('Exactly one of threshold and clusters must be given.')
+    if linkage not in LINKAGES:
+        raise ValueError('linkage must be one of ' + str(tuple(LINKAGES)))
+    update = LINKAGES[linkage]
+
+    distances = _Distances(configurations)
+    count = len(distances)
+    if clusters is not None and not 1 <= clusters <= max(count, 1):
+        raise ValueError('clusters must be between 1 and the number of Configurations.')
+
+    # Linkage distances, updated in place as clusters merge; each merged
+    # cluster keeps the index of one of its halves.
+    linked = [[distances(i, j) for j in range(count)] for i in range(count)]
+    sizes = [1] * count
+    active = [True] * count
+    remaining = count
+    merges = []
+    chain = []
+
+    while remaining > 1:
+        if not chain:
+            chain.append(active.index(True))
+        top = chain[-1]
+        previous = chain[-2] if len(chain) > 1 else None
+
+        # Nearest neighbour of the top of the chain, preferring the
+        # previous link on ties so that the chain terminates
+        nearest = previous
+        nearest_distance = linked[top][previous] if previous is not None else float('inf')
+        row = linked[top]
+        for other in range(count):
+            if active[other] and other != top and row[other] < nearest_distance:
+                nearest, nearest_distance = other, row[other]
+
+        if nearest != previous:
+            chain.append(nearest)
+            continue
+
+        # Reciprocal nearest neighbours: merge them
+        chain.pop()
+        chain.pop()
+        merges.append((nearest_distance, top, previous))
+        for other in range(count):
+            if active[other] and other not in (top, previous):
+                distance = update(linked[top][other], linked[previous][other],
+                                  sizes[top], sizes[previous])
+                linked[top][other] = linked[other][top] = distance
+        sizes[top] += sizes[previous]
+        active[previous] = False
+        remaining -= 1
+
+    # Apply the merges in order of distance up to the cut
+    merges.sort(key=lambda merge: merge[0])
+    if clusters is not None:
+        merges = merges[:count - clusters]
+    else:
+        merges = [merge for merge in merges if merge[0] <= threshold]
+
+    parents = list(range(count))
+
+    def root(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for _, a, b in merges:
+        parents[root(b)] = root(a)
+
+    labels = [root(i) for i in range(count)]
+    members = {}
+    for i, label in enumerate(labels):
+        members.setdefault(label, []).append(i)
+    medoids = {}
+    for label, cluster_members in members.items():
+        medoids[label] = min(cluster_members, key=lambda candidate: sum(
+            distances(candidate, other) for other in cluster_members))
+
+    labels, representatives = _relabel(labels, medoids)
+    return Clustering(configurations, labels, representatives, len(distances.cache))
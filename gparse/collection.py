@@ -0,0 +1,214 @@
+"""
+Defines SpectrumCollection class for columnar storage and batched
+evaluation of many spectra.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+from array import array
+
+from .spectrum import Spectrum, spectrum_attribute
+from .util import linspace
+
+
+class SpectrumCollection:
+    """
+    Stores many stick spectra in concatenated arrays, with the sticks of
+    spectrum i at positions offsets[i] to offsets[i + 1]. Each spectrum
+    may be associated with the Configuration it was calculated for.
+    """
+
+    # Default number of spectra evaluated together in one chunk.
+    CHUNK_SIZE = 256
+
+    def __init__(self, spectra=(), configurations=None):
+        """
+        Constructor.
+        :param spectra: an iterable of Spectrum objects.
+        :param configurations: an optional iterable of the Configurations
+        the spectra belong to, in the same order.
+        """
+
+        self.frequencies = array('d')
+        self.intensities = array('d')
+        self.widths = array('d')
+        self.offsets = array('q', [0])
+        self.configurations = []
+        self._plotter = None
+
+        if configurations is None:
+            for spectrum in spectra:
+                self.append(spectrum)
+        else:
+            spectra, configurations = list(spectra), list(configurations)
+            if len(spectra) != len(configurations):
+                raise ValueError(
+                    'There must be one Configuration for each Spectrum.')
+            for spectrum, configuration in zip(spectra, configurations):
+                self.append(spectrum, configuration)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, key):
+        """
+        Index to get a Spectrum view of one spectrum, or slice to get
+        a new SpectrumCollection.
+        """
+
+        if isinstance(key, slice):
+            return self.take(range(*key.indices(len(self))))
+
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('SpectrumCollection index out of range')
+        start, end = self.offsets[key], self.offsets[key + 1]
+        return Spectrum(self.frequencies[start:end].tolist(),
+                        self.intensities[start:end].tolist(),
+                        self.widths[key])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, spectrum, configuration=None):
+        """
+        Add a spectrum to the end of the collection.
+        :param spectrum: a Spectrum.
+        :param configuration: the Configuration the spectrum belongs to.
+        """
+
+        self.frequencies.extend(spectrum.frequencies)
+        self.intensities.extend(spectrum.intensities)
+        self.widths.append(spectrum.lorentzian_width)
+        self.offsets.append(len(self.frequencies))
+        self.configurations.append(configuration)
+
+    def take(self, indices):
+        """
+        Create a new SpectrumCollection from the spectra at the given indices.
+        """
+
+        collection = SpectrumCollection()
+        for i in indices:
+            start, end = self.offsets[i], self.offsets[i + 1]
+            collection.frequencies.extend(self.frequencies[start:end])
+            collection.intensities.extend(self.intensities[start:end])
+            collection.widths.append(self.widths[i])
+            collection.offsets.append(len(collection.frequencies))
+            collection.configurations.append(self.configurations[i])
+        return collection
+
+    def select(self, predicate):
+        """
+        Create a new SpectrumCollection of the spectra whose Configuration
+        satisfies predicate.
+        :param predicate: a function of a Configuration returning a boolean.
+        """
+
+        return self.take([i for i, configuration in enumerate(self.configurations)
+                          if configuration is not None and predicate(configuration)])
+
+    def where(self, **attributes):
+        """
+        Create a new SpectrumCollection of the spectra whose Configuration has
+        the given attribute values, e.g. collection.where(temperature=300).
+        """
+
+        def matches(configuration):
+            return all(getattr(configuration, name, None) == value
+                       for name, value in attributes.items())
+
+        return self.select(matches)
+
+    def x_array(self, x_min=None, x_max=None, points=Spectrum.NUMBER_OF_POINTS):
+        """
+        Compute an evenly spaced grid covering every spectrum in the collection.
+        """
+
+        x_min = min(self.frequencies) if x_min is None else x_min
+        x_max = max(self.frequencies) if x_max is None else x_max
+        return linspace(x_min, x_max, points)
+
+    def iter_evaluate(self, x_array, chunk_size=CHUNK_SIZE):
+        """
+        Evaluate the lorentzian fit of every spectrum on a shared grid,
+        generating lists of rows for chunk_size spectra at a time so that
+        only one chunk of the result need be held in memory.
+        :param x_array: the points at which to evaluate.
+        :param chunk_size: number of spectra per chunk.
+        """
+
+        x_array = list(x_array)
+        zeros = [0] * len(x_array)
+        frequencies, intensities = self.frequencies, self.intensities
+
+        for chunk_start in range(0, len(self), chunk_size):
+            rows = []
+            for i in range(chunk_start, min(chunk_start + chunk_size, len(self))):
+                width_squared = self.widths[i]**2
+                row = zeros
+                for k in range(self.offsets[i], self.offsets[i + 1]):
+                    # Same arithmetic, in the same order, as Spectrum.fit_function
+                    center, amplitude = frequencies[k], intensities[k]
+                    row = [total + amplitude * (width_squared / ((x - center)**2 + width_squared))
+                           for total, x in zip(row, x_array)]
+                rows.append(row)
+            yield rows
+
+    def evaluate(self, x_array, chunk_size=CHUNK_SIZE):
+        """
+        Evaluate the lorentzian fit of every spectrum on a shared grid.
+        :param x_array: the points at which to evaluate.
+        :returns: a list of rows, one per spectrum, of values at each point.
+        """
+
+        return [row for rows in self.iter_evaluate(x_array, chunk_size) for row in rows]
+
+    def average(self, x_array, chunk_size=CHUNK_SIZE):
+        """
+        Evaluate the average of the lorentzian fits of every spectrum on a
+        shared grid.
+        """
+
+        if not len(self):
+            raise ValueError('Cannot average an empty SpectrumCollection.')
+        totals = [0] * len(x_array)
+        for rows in self.iter_evaluate(x_array, chunk_size):
+            for row in rows:
+                totals = [total + value for total, value in zip(totals, row)]
+        return [total / len(self) for total in totals]
+
+    def plot(self, axis, x_min=None, x_max=None, pixels=None, max_lines=50,
+             method='minmax', **kwargs):
+        """
+        Plot the lorentzian fits of the collection, downsampled to the width
+        of the axis, or as percentile bands if there are more than max_lines.
+        Curves are cached between calls with the same x range and width.
+        See plotting.SpectrumPlotter.
+        """
+
+        from .plotting import SpectrumPlotter
+
+        plotter = self._plotter
+        if plotter is None or (plotter.max_lines, plotter.method) != (max_lines, method):
+            plotter = self._plotter = SpectrumPlotter(self, max_lines, method)
+        plotter.plot(axis, x_min, x_max, pixels, **kwargs)
+
+    @staticmethod
+    def from_configurations(configurations, type='raman'):
+        """
+        Create a SpectrumCollection from the spectra of Configurations.
+        :param configurations: an iterable of Configuration objects.
+        :param type: 'raman' or 'ir', the spectrum to take from each.
+        """
+
+        attribute = spectrum_attribute(type)
+
+        collection = SpectrumCollection()
+        for configuration in configurations:
+            collection.append(getattr(configuration, attribute), configuration)
+        return collection
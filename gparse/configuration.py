@@ -9,6 +9,8 @@ Copyright Sean McGrath 2015. Issued under the MIT License.
 
 from .spectrum import Spectrum
 from .matrix import DistanceMatrix
+from . import fchk
+from .logfile import open_log
 
 
 class Configuration:
@@ -49,11 +51,34 @@ class Configuration:
         """
         Create a Configuration from the information
         in a Gaussian .log file.
-        :param filename: path to a .log file generated by Gaussian.
+        :param filename: path to a .log file generated by Gaussian,
+        which may be compressed with gzip, xz or bz2.
         """
 
-        raman = Spectrum.from_log_file(filename, type='raman')
-        ir = Spectrum.from_log_file(filename, type='ir')
-        matrix = DistanceMatrix.from_log_file(filename)
+        # Read (and decompress) the file once for all three parsers
+        with open_log(filename) as open_file:
+            lines = open_file.readlines()
+
+        raman = Spectrum.from_log_lines(lines, type='raman')
+        ir = Spectrum.from_log_lines(lines, type='ir')
+        matrix = DistanceMatrix.from_log_lines(lines)
+
+        return Configuration(matrix, raman, ir, time, temp)
+
+    @staticmethod
+    def from_fchk(filename, time=None, temp=None):
+        """
+        Create a Configuration from a Gaussian formatted checkpoint (.fchk)
+        file. The raman spectrum is None if the job did not compute one.
+        :param filename: path to the .fchk file, which may be compressed.
+        """
+
+        values = fchk.read_fchk(filename, fchk.SPECTRUM_LABELS + fchk.MATRIX_LABELS)
+
+        raman = None
+        if 'raman_activity' in fchk.vibrations(values):
+            raman = Spectrum.from_fchk_values(values, 'raman')
+        ir = Spectrum.from_fchk_values(values, 'ir')
+        matrix = DistanceMatrix(fchk.distance_matrix(values))
 
         return Configuration(matrix, raman, ir, time, temp)
@@ -0,0 +1,279 @@
+"""
+Defines EnsembleStore class for sharing the distance matrices and
+spectra of many Configurations with worker processes without copying.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+from array import array
+from collections import namedtuple
+from functools import partial
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+from .collection import SpectrumCollection
+from .matrix import DistanceMatrix
+from .spectrum import Spectrum, spectrum_type, spectrum_attribute
+from .util import rms_deviation
+
+
+# Everything a worker needs to attach to an EnsembleStore. Small enough
+# to pickle cheaply: arrays maps the name of each shared array to its
+# (byte offset, typecode, length) in the shared memory block.
+EnsembleHandle = namedtuple('EnsembleHandle', ('name', 'count', 'atoms', 'stride', 'units', 'arrays'))
+
+
+def _ensemble_arrays(configurations):
+    """
+    Stack the distances and spectra of Configurations into flat arrays.
+    Spectra are only included for types every Configuration has.
+    :returns: (atoms, stride, units, dict of array name to array).
+    """
+
+    atoms, stride, units, distances = DistanceMatrix.stack(
+        configuration.matrix for configuration in configurations)
+
+    arrays = {'distances': distances}
+    for type in ('raman', 'ir'):
+        spectra = [getattr(configuration, spectrum_attribute(type)) for configuration in configurations]
+        if any(spectrum is None for spectrum in spectra):
+            continue
+        collection = SpectrumCollection(spectra)
+        arrays.update({type + '_frequencies': collection.frequencies,
+                       type + '_intensities': collection.intensities,
+                       type + '_widths': collection.widths,
+                       type + '_offsets': collection.offsets})
+
+    return atoms, stride, units, arrays
+
+
+class EnsembleStore:
+    """
+    Places the distance matrices and spectra of an ensemble of
+    Configurations in one block of OS shared memory, so that worker
+    processes can read them without the Configurations being pickled.
+
+    The store owns the shared memory: call close() and unlink() when
+    finished with it, or use it as a context manager, which does both.
+    Workers attach through the picklable handle with EnsembleView.
+    """
+
+    def __init__(self, configurations):
+        """
+        Constructor. Copies the data of every Configuration into shared memory.
+        :param configurations: an iterable of Configurations with the same atoms.
+        """
+
+        configurations = list(configurations)
+        if not configurations:
+            raise ValueError('An EnsembleStore needs at least one Configuration.')
+        atoms, stride, units, arrays = _ensemble_arrays(configurations)
+
+        layout = {}
+        size = 0
+        for name, values in arrays.items():
+            layout[name] = (size, values.typecode, len(values))
+            size += len(values) * values.itemsize
+
+        self._memory = SharedMemory(create=True, size=max(size, 1))
+        for name, values in arrays.items():
+            offset = layout[name][0]
+            self._memory.buf[offset:offset + len(values) * values.itemsize] = values.tobytes()
+
+        self.handle = EnsembleHandle(self._memory.name, len(configurations),
+                                     atoms, stride, units, layout)
+        self._unlinked = False
+
+    def __len__(self):
+        return self.handle.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        self.unlink()
+
+    def view(self):
+        """
+        Attach an EnsembleView in this process, e.g. for serial work.
+        The view must be closed before the store.
+        """
+
+        return EnsembleView(self.handle)
+
+    def close(self):
+        """
+        Release this process's access to the shared memory.
+        """
+
+        self._memory.close()
+
+    def unlink(self):
+        """
+        Free the shared memory once every process has closed it.
+        """
+
+        if not self._unlinked:
+            self._memory.unlink()
+            self._unlinked = True
+
+    def map(self, function, indices=None, processes=None, chunksize=None):
+        """
+        Call function(view, index) for each index in a pool of worker
+        processes, each attached once to the shared memory.
+        :param function: a picklable (module level) function of an
+        EnsembleView and a Configuration index.
+        :param indices: the Configuration indices, defaulting to all.
+        :param processes: number of workers, defaulting to the CPU count.
+        :param chunksize: number of indices sent to a worker at a time,
+        chosen by the pool if not given.
+        :returns: a list of the results, in the order of indices.
+        """
+
+        indices = range(len(self)) if indices is None else list(indices)
+        with Pool(processes, initializer=_attach, initargs=(self.handle,)) as pool:
+            return pool.map(partial(_call, function), indices, chunksize)
+
+    def rms_deviations(self, reference, indices=None, processes=None, distance_threshold=None):
+        """
+        Calculate the root mean square deviation of the distance matrix
+        of each Configuration from that of a reference Configuration.
+        :param reference: index of the reference Configuration.
+        :param distance_threshold: as for DistanceMatrix.rms_deviation.
+        """
+
+        function = partial(_rms_deviation, reference=reference,
+                           distance_threshold=distance_threshold)
+        return self.map(function, indices, processes)
+
+
+# The view attached by each pool worker, set by _attach.
+_worker_view = None
+
+
+def _attach(handle):
+    global _worker_view
+    _worker_view = EnsembleView(handle)
+
+
+def _call(function, index):
+    return function(_worker_view, index)
+
+
+def _rms_deviation(view, index, reference, distance_threshold):
+    return view.rms_deviation(reference, index, distance_threshold)
+
+
+class EnsembleView:
+    """
+    Read-only access to the data of an EnsembleStore from any process.
+
+    Accessors return memoryviews into the shared memory rather than
+    copies. They are only valid until the view is closed, and must all
+    be released before it can be.
+    """
+
+    def __init__(self, handle):
+        """
+        Constructor. Attaches to the shared memory of a store.
+        :param handle: the EnsembleHandle of the store.
+        """
+
+        self.handle = handle
+        self._memory = SharedMemory(name=handle.name)
+        self._arrays = {}
+        for name, (offset, typecode, length) in handle.arrays.items():
+            end = offset + length * array(typecode).itemsize
+            self._arrays[name] = self._memory.buf[offset:end].cast(typecode)
+
+    def __len__(self):
+        return self.handle.count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Detach from the shared memory.
+        """
+
+        for values in self._arrays.values():
+            values.release()
+        self._arrays = {}
+        self._memory.close()
+
+    def _check_index(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('EnsembleView index out of range')
+        return index
+
+    def distances(self, index):
+        """
+        The flattened distance matrix of one Configuration.
+        """
+
+        index = self._check_index(index)
+        stride = self.handle.stride
+        return self._arrays['distances'][index * stride:(index + 1) * stride]
+
+    def matrix(self, index):
+        """
+        Copy the distance matrix of one Configuration into a DistanceMatrix.
+        """
+
+        values = self.distances(index).tolist()
+        atoms = self.handle.atoms
+        if self.handle.stride == atoms * atoms:
+            rows = [values[i * atoms:(i + 1) * atoms] for i in range(atoms)]
+        else:
+            rows = [values[i * (i + 1) // 2:(i + 1) * (i + 2) // 2] for i in range(atoms)]
+        return DistanceMatrix(rows, self.handle.units)
+
+    def rms_deviation(self, index, other, distance_threshold=None):
+        """
+        Calculate the root mean square deviation between the distance
+        matrices of two Configurations, as DistanceMatrix.rms_deviation.
+        """
+
+        return rms_deviation(self.distances(index), self.distances(other), distance_threshold)
+
+    def _spectrum_arrays(self, index, type):
+        type = spectrum_type(type)
+        if type + '_offsets' not in self._arrays:
+            raise ValueError('Every Configuration must have a {}.'.format(spectrum_attribute(type)))
+        index = self._check_index(index)
+        offsets = self._arrays[type + '_offsets']
+        start, end = offsets[index], offsets[index + 1]
+        return (self._arrays[type + '_frequencies'][start:end],
+                self._arrays[type + '_intensities'][start:end],
+                self._arrays[type + '_widths'][index])
+
+    def frequencies(self, index, type='raman'):
+        """
+        The frequencies of the spectrum of one Configuration.
+        """
+
+        return self._spectrum_arrays(index, type)[0]
+
+    def intensities(self, index, type='raman'):
+        """
+        The intensities of the spectrum of one Configuration.
+        """
+
+        return self._spectrum_arrays(index, type)[1]
+
+    def spectrum(self, index, type='raman'):
+        """
+        Copy the spectrum of one Configuration into a Spectrum.
+        """
+
+        frequencies, intensities, width = self._spectrum_arrays(index, type)
+        return Spectrum(frequencies.tolist(), intensities.tolist(), width)
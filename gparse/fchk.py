@@ -0,0 +1,172 @@
+"""
+Functions for reading Gaussian formatted checkpoint (.fchk) files.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+from .logfile import open_log
+from .util import decode_floats
+
+
+# Angstroms per bohr, the unit of .fchk coordinates.
+BOHR = 0.52917721092
+
+# Per-mode properties stored one after another in the Vib-E2 array,
+# in the order of the SpectralPeak constructor arguments.
+VIB_E2_FIELDS = ('frequency', 'reduced_mass', 'frc_const', 'ir_intensity',
+                 'raman_activity', 'depolar_p', 'depolar_u')
+
+# Number of array values on each line, by type: integer, real,
+# character, Hollerith and logical.
+VALUES_PER_LINE = {'I': 6, 'R': 5, 'C': 5, 'H': 9, 'L': 72}
+
+# Labels needed for each kind of data.
+SPECTRUM_LABELS = ('Number of Normal Modes', 'Vib-E2')
+MATRIX_LABELS = ('Current cartesian coordinates',)
+MODE_LABELS = ('Number of atoms', 'Atomic numbers', 'Number of Normal Modes',
+               'Vib-E2', 'Vib-Modes')
+
+
+def read_fchk(filename, labels=None):
+    """
+    Read the labelled values of a .fchk file into a dict.
+    Arrays not in labels are skipped without being decoded.
+    :param filename: path to the .fchk file, which may be compressed.
+    :param labels: an iterable of the labels to read, or None for all.
+    :returns: a dict of label to value: an int, float or string for
+    scalars, and a list for arrays.
+    """
+
+    wanted = None if labels is None else set(labels)
+    values = {}
+
+    with open_log(filename) as fchk_file:
+        # The first two lines are the title and the job type/method/basis
+        fchk_file.readline()
+        fchk_file.readline()
+
+        line_number = 2
+        for line in fchk_file:
+            line_number += 1
+            if not line.strip():
+                continue
+            label = line[:43].strip()
+            fields = line[43:].split()
+            if not label or not fields:
+                raise ValueError('Malformed .fchk header on line {}: {!r}'.format(
+                    line_number, line))
+            value_type = fields[0]
+
+            if len(fields) > 2 and fields[1] == 'N=':
+                count = int(fields[2])
+                per_line = VALUES_PER_LINE[value_type]
+                data = [next(fchk_file, '') for _ in range(-(-count // per_line))]
+                header_line = line_number
+                line_number += len(data)
+                if wanted is None or label in wanted:
+                    values[label] = _decode_array(value_type, count, data, header_line)
+
+            elif wanted is None or label in wanted:
+                values[label] = _decode_scalar(value_type, ' '.join(fields[1:]))
+
+    return values
+
+
+def _decode_array(value_type, count, lines, header_line):
+    """
+    Decode the data lines of one .fchk array in bulk.
+    """
+
+    if value_type in ('C', 'H'):
+        # Fixed width text
+        return ''.join(line.rstrip('\n') for line in lines)
+
+    tokens = ''.join(lines).split()
+    if value_type == 'I':
+        values = list(map(int, tokens))
+    elif value_type == 'L':
+        values = [token == 'T' for token in tokens]
+    else:
+        values = decode_floats(tokens, header_line + 1)
+
+    if len(values) != count:
+        raise ValueError('Expected {} values in the array on line {}, found {}.'.format(
+            count, header_line, len(values)))
+    return values
+
+
+def _decode_scalar(value_type, text):
+    if value_type == 'I':
+        return int(text)
+    if value_type == 'R':
+        return float(text)
+    if value_type == 'L':
+        return text == 'T'
+    return text
+
+
+def vibrations(values):
+    """
+    Split the Vib-E2 array read from a .fchk file into per-mode properties.
+    :param values: a dict from read_fchk including 'Vib-E2' and
+    'Number of Normal Modes'.
+    :returns: a dict of VIB_E2_FIELDS name to list of values, one per mode.
+    Fields absent from the file, e.g. raman activities of a job run
+    without raman, are left out.
+    """
+
+    if 'Vib-E2' not in values:
+        raise ValueError('The .fchk file has no vibrational analysis.')
+    vib_e2 = values['Vib-E2']
+
+    modes = values.get('Number of Normal Modes')
+    if modes is None and 'Vib-Modes' in values and 'Number of atoms' in values:
+        modes = len(values['Vib-Modes']) // (3 * values['Number of atoms'])
+    if not modes:
+        raise ValueError('The .fchk file has no normal modes.')
+
+    fields = {}
+    for i, name in enumerate(VIB_E2_FIELDS):
+        if len(vib_e2) >= (i + 1) * modes:
+            fields[name] = vib_e2[i * modes:(i + 1) * modes]
+    return fields
+
+
+def normal_modes(values):
+    """
+    Get the displacement vectors read from a .fchk file.
+    :param values: a dict from read_fchk including the MODE_LABELS.
+    :returns: a list with a list of (atomic number, x, y, z) per atom for
+    each mode.
+    """
+
+    for label in MODE_LABELS:
+        if label not in values:
+            raise ValueError('The .fchk file has no {}.'.format(label))
+    elements = values['Atomic numbers']
+    displacements = values['Vib-Modes']
+    stride = 3 * len(elements)
+
+    modes = []
+    for start in range(0, len(displacements), stride):
+        vector = displacements[start:start + stride]
+        modes.append([(element, vector[3 * i], vector[3 * i + 1], vector[3 * i + 2])
+                      for i, element in enumerate(elements)])
+    return modes
+
+
+def distance_matrix(values):
+    """
+    Compute the lower triangular distance matrix, in angstroms,
+    from the coordinates read from a .fchk file.
+    """
+
+    if 'Current cartesian coordinates' not in values:
+        raise ValueError('The .fchk file has no cartesian coordinates.')
+    coordinates = [component * BOHR for component in values['Current cartesian coordinates']]
+    atoms = [coordinates[i:i + 3] for i in range(0, len(coordinates), 3)]
+
+    return [[sum((a - b)**2 for a, b in zip(atoms[i], atoms[j]))**0.5 for j in range(i + 1)]
+            for i in range(len(atoms))]
@@ -0,0 +1,277 @@
+"""
+Defines tools for fitting the lorentzian width, frequency scale and
+intensity scale of calculated spectra to experimental data.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+from .spectrum import Spectrum
+
+
+class FitResult:
+    """
+    The outcome of fitting spectra to a target: the fitted parameters and
+    how well they fit.
+    """
+
+    def __init__(self, width, frequency_scale, intensity_scale,
+                 rms_residual, iterations, converged):
+        """
+        Constructor.
+        :param width: fitted lorentzian width.
+        :param frequency_scale: factor by which to multiply frequencies.
+        :param intensity_scale: factor by which to multiply intensities.
+        :param rms_residual: root mean square difference from the target.
+        :param iterations: number of iterations taken.
+        :param converged: whether the fit converged within the iteration limit.
+        """
+
+        self.width = width
+        self.frequency_scale = frequency_scale
+        self.intensity_scale = intensity_scale
+        self.rms_residual = rms_residual
+        self.iterations = iterations
+        self.converged = converged
+
+    def __repr__(self):
+        return 'FitResult(width={}, frequency_scale={}, intensity_scale={}, rms_residual={})'.format(
+            self.width, self.frequency_scale, self.intensity_scale, self.rms_residual)
+
+    def apply(self, spectrum):
+        """
+        Create a copy of a spectrum with the fitted parameters applied.
+        :param spectrum: a Spectrum.
+        """
+
+        return Spectrum([frequency * self.frequency_scale for frequency in spectrum.frequencies],
+                        [intensity * self.intensity_scale for intensity in spectrum.intensities],
+                        self.width)
+
+
+def _target_points(target):
+    """
+    Get the (x values, y values) of a target, which may be a Spectrum,
+    e.g. experimental data read by Spectrum.from_csv, or a pair of sequences.
+    """
+
+    if isinstance(target, Spectrum):
+        return list(target.frequencies), list(target.intensities)
+    x_values, y_values = target
+    if len(x_values) != len(y_values):
+        raise ValueError('Target must have an equal number of x and y values.')
+    return list(x_values), list(y_values)
+
+
+def _accumulate(spectrum, x_values, y_values, parameters, gradients=True):
+    """
+    Evaluate the scaled lorentzian sum of a spectrum against a target in one
+    pass. Returns the sum of squared residuals and, if gradients is true,
+    the normal matrix J^T J and gradient vector J^T r built from the analytic
+    derivatives with respect to width, frequency scale and intensity scale.
+    """
+
+    width, scale, amplitude = parameters
+    width_squared = width * width
+    peaks = [(frequency * scale, frequency, intensity)
+             for frequency, intensity in zip(spectrum.frequencies, spectrum.intensities)]
+
+    cost = 0.0
+    normal = [[0.0] * 3 for _ in range(3)]
+    gradient = [0.0] * 3
+
+    for x, y in zip(x_values, y_values):
+        total = d_width = d_scale = 0.0
+        for center, frequency, intensity in peaks:
+            distance = x - center
+            denominator = distance * distance + width_squared
+            value = intensity * width_squared / denominator
+            total += value
+            if gradients:
+                # d/dw of w^2 / (d^2 + w^2) is 2 w d^2 / (d^2 + w^2)^2, and
+                # d/ds (with d = x - s f) is 2 d w^2 f / (d^2 + w^2)^2.
+                common = 2 * value / denominator
+                d_width += common * distance * distance / width
+                d_scale += common * distance * frequency
+
+        residual = amplitude * total - y
+        cost += residual * residual
+        if gradients:
+            jacobian = (amplitude * d_width, amplitude * d_scale, total)
+            for i in range(3):
+                gradient[i] += jacobian[i] * residual
+                for j in range(i + 1):
+                    normal[i][j] += jacobian[i] * jacobian[j]
+
+    if not gradients:
+        return cost
+    for i in range(3):
+        for j in range(i):
+            normal[j][i] = normal[i][j]
+    return cost, normal, gradient
+
+
+def _solve(matrix, vector):
+    """
+    Solve a small linear system by Gaussian elimination with partial
+    pivoting. Returns None if the system is singular.
+    """
+
+    size = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for column in range(size):
+        pivot = max(range(column, size), key=lambda row: abs(rows[row][column]))
+        if rows[pivot][column] == 0:
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, size):
+            factor = rows[row][column] / rows[column][column]
+            for k in range(column, size + 1):
+                rows[row][k] -= factor * rows[column][k]
+
+    solution = [0.0] * size
+    for row in reversed(range(size)):
+        known = sum(rows[row][k] * solution[k] for k in range(row + 1, size))
+        solution[row] = (rows[row][size] - known) / rows[row][row]
+    return solution
+
+
+def _average_spectrum(spectra):
+    """
+    Combine spectra into one Spectrum whose lorentzian sum is the mean of
+    theirs: every peak, with its intensity divided by the number of spectra.
+    """
+
+    frequencies, intensities = [], []
+    for spectrum in spectra:
+        frequencies.extend(spectrum.frequencies)
+        intensities.extend(intensity / len(spectra) for intensity in spectrum.intensities)
+    return Spectrum(frequencies, intensities, spectra[0].lorentzian_width)
+
+
+class _Problem:
+    """
+    State of one Levenberg-Marquardt fit: the average of a group of spectra
+    that share one set of parameters, ordered (width, frequency scale,
+    intensity scale).
+    """
+
+    def __init__(self, spectrum, parameters):
+        self.spectrum = spectrum
+        self.parameters = list(parameters)
+        self.damping = 1e-3
+        self.cost = None
+        self.iterations = 0
+        self.converged = False
+
+    def evaluate(self, x_values, y_values, parameters, gradients=True):
+        return _accumulate(self.spectrum, x_values, y_values, parameters, gradients)
+
+
+def _initial_intensity_scale(spectrum, x_values, y_values, width, frequency_scale):
+    """
+    Linear least squares intensity scale for fixed width and frequency scale.
+    """
+
+    _, normal, gradient = _accumulate(
+        spectrum, x_values, y_values, (width, frequency_scale, 1.0))
+    # With unit amplitude, J_a = model, so J_a.J_a = sum(model^2) and
+    # J_a.r = sum(model^2) - sum(model * target).
+    numerator = normal[2][2] - gradient[2]
+    denominator = normal[2][2]
+    return numerator / denominator if denominator else 1.0
+
+
+def fit_spectra(spectra, target, width=None, frequency_scale=1.0, intensity_scale=None,
+                fit_width=True, fit_frequency_scale=True, fit_intensity_scale=True,
+                per_spectrum=False, max_iterations=100, tolerance=1e-10):
+    """
+    Fit the lorentzian width, frequency scale and intensity scale of
+    calculated spectra to a target by Levenberg-Marquardt least squares,
+    using analytic gradients of the lorentzian sum.
+    :param spectra: a Spectrum or an iterable of Spectrum objects.
+    :param target: the Spectrum, e.g. from Spectrum.from_csv, or pair of
+    (x values, y values) to fit to.
+    :param width: initial lorentzian width, defaults to that of the first spectrum.
+    :param frequency_scale: initial frequency scale factor.
+    :param intensity_scale: initial intensity scale factor, by default the
+    best linear fit for the initial width and frequency scale.
+    :param fit_width, fit_frequency_scale, fit_intensity_scale: which of the
+    parameters to fit; the others are held at their initial values.
+    :param per_spectrum: fit each spectrum separately instead of one set of
+    parameters to all of them. All fits are iterated together. Otherwise
+    the average of the spectra, e.g. of an ensemble of Configurations, is
+    fitted to the target.
+    :param max_iterations: maximum number of iterations per fit.
+    :param tolerance: relative change in squared residual at which a fit
+    has converged.
+    :returns: a FitResult, or a list of FitResults if per_spectrum is true.
+    """
+
+    single = isinstance(spectra, Spectrum)
+    spectra = [spectra] if single else list(spectra)
+    if not spectra:
+        raise ValueError('There must be at least one spectrum to fit.')
+
+    x_values, y_values = _target_points(target)
+    if width is None:
+        width = spectra[0].lorentzian_width
+    active = [i for i, fit in enumerate((fit_width, fit_frequency_scale, fit_intensity_scale))
+              if fit]
+
+    fitted = spectra if per_spectrum else [_average_spectrum(spectra)]
+    problems = []
+    for spectrum in fitted:
+        scale = intensity_scale
+        if scale is None:
+            scale = _initial_intensity_scale(spectrum, x_values, y_values, width, frequency_scale)
+        problems.append(_Problem(spectrum, (width, frequency_scale, scale)))
+
+    unfinished = list(problems) if active else []
+    while unfinished:
+        for problem in unfinished:
+            cost, normal, gradient = problem.evaluate(x_values, y_values, problem.parameters)
+            problem.cost = cost
+            problem.iterations += 1
+
+            # Try steps with increasing damping until one reduces the residual
+            while True:
+                matrix = [[normal[i][j] * (1 + problem.damping if i == j else 1)
+                           for j in active] for i in active]
+                step = _solve(matrix, [-gradient[i] for i in active])
+                if step is not None:
+                    trial = list(problem.parameters)
+                    for i, change in zip(active, step):
+                        trial[i] += change
+                    if trial[0] > 0:
+                        trial_cost = problem.evaluate(x_values, y_values, trial,
+                                                      gradients=False)
+                        if trial_cost <= cost:
+                            problem.parameters = trial
+                            problem.cost = trial_cost
+                            problem.damping = max(problem.damping / 10, 1e-12)
+                            problem.converged = cost - trial_cost <= tolerance * cost
+                            break
+
+                problem.damping *= 10
+                if problem.damping > 1e10:
+                    # No downhill step left: at a minimum to machine precision
+                    problem.converged = True
+                    break
+
+        unfinished = [problem for problem in unfinished
+                      if not problem.converged and problem.iterations < max_iterations]
+
+    results = []
+    for problem in problems:
+        if problem.cost is None:
+            problem.cost = problem.evaluate(x_values, y_values, problem.parameters,
+                                            gradients=False)
+        results.append(FitResult(problem.parameters[0], problem.parameters[1],
+                                 problem.parameters[2], (problem.cost / len(x_values)) ** 0.5,
+                                 problem.iterations, problem.converged))
+
+    if per_spectrum and not single:
+        return results
+    return results[0]
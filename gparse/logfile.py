@@ -0,0 +1,260 @@
+"""
+Functions for reading Gaussian .log files that may be compressed,
+and for jumping straight to sections of large logs.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import zlib
+
+
+# Leading bytes identifying each supported compression format.
+MAGIC_NUMBERS = (
+    (b'\x1f\x8b', 'gzip'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'BZh', 'bz2'),
+)
+
+_OPENERS = {'gzip': gzip.open, 'xz': lzma.open, 'bz2': bz2.open}
+
+# Number of bytes read from disk at a time when scanning a log.
+CHUNK_SIZE = 1 << 16
+
+
+def compression(filename):
+    """
+    Identify the compression of a file from its leading bytes.
+    :returns: 'gzip', 'xz', 'bz2', or None for an uncompressed file.
+    """
+
+    with open(filename, 'rb') as raw:
+        start = raw.read(6)
+    for magic, name in MAGIC_NUMBERS:
+        if start.startswith(magic):
+            return name
+    return None
+
+
+def open_log(filename, section=None, index=None):
+    """
+    Open a Gaussian .log file for reading as text, decompressing gzip, xz
+    and bz2 files on the fly as they are read.
+    :param filename: path to the (possibly compressed) .log file.
+    :param section: if given, the name of a SectionIndex section at which
+    to start reading, e.g. 'frequencies'.
+    :param index: the SectionIndex of the file, used when section is given.
+    Built by scanning the file if not given.
+    """
+
+    kind = compression(filename)
+    if section is None:
+        if kind is None:
+            return open(filename)
+        return _OPENERS[kind](filename, 'rt')
+
+    if index is None:
+        index = SectionIndex.build(filename)
+    index.check(filename)
+    member_offset, skip = index.locate(section)
+
+    raw = open(filename, 'rb')
+    if kind is None:
+        raw.seek(member_offset + skip)
+        return io.TextIOWrapper(raw)
+
+    if kind == 'gzip':
+        # Each gzip member can be decompressed on its own, so start at the
+        # member holding the section and only inflate from there.
+        raw.seek(member_offset)
+        stream = _OwningGzipFile(raw)
+    else:
+        raw.close()
+        stream = _OPENERS[kind](filename, 'rb')
+        skip += member_offset
+
+    while skip:
+        skipped = len(stream.read(min(skip, CHUNK_SIZE)))
+        if not skipped:
+            break
+        skip -= skipped
+    return io.TextIOWrapper(stream)
+
+
+class _OwningGzipFile(gzip.GzipFile):
+    """
+    A GzipFile reading from an already positioned file object,
+    which it closes when it is closed.
+    """
+
+    def __init__(self, raw):
+        super().__init__(fileobj=raw, mode='rb')
+        self._raw = raw
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._raw.close()
+
+
+class SectionIndex:
+    """
+    Records where the sections of a Gaussian .log file start, so that
+    readers can skip straight to them.
+
+    For multi-member gzip files, such as those written by bgzip, the
+    compressed offset of every member is recorded too, so that reading a
+    section only decompresses from the member containing it. Other
+    compressed files must still be decompressed from the start, but are
+    not parsed until the section is reached.
+    """
+
+    # Text marking the start of each section.
+    SECTIONS = {
+        'matrix': 'Distance matrix',
+        'frequencies': 'Harmonic frequencies',
+    }
+
+    def __init__(self, size, members, sections):
+        """
+        Constructor.
+        :param size: size in bytes of the indexed file.
+        :param members: (compressed offset, uncompressed offset) of the start
+        of each independently decompressible member, in order.
+        :param sections: uncompressed offset of the start of each section found.
+        """
+
+        self.size = size
+        self.members = [tuple(member) for member in members]
+        self.sections = dict(sections)
+
+    def __contains__(self, section):
+        return section in self.sections
+
+    def locate(self, section):
+        """
+        Find where to start reading a section.
+        :returns: (compressed offset of the member holding the section,
+        uncompressed bytes to skip from the start of that member).
+        """
+
+        if section not in self.sections:
+            raise ValueError('Section {!r} was not found in the log.'.format(section))
+        offset = self.sections[section]
+        member = max((m for m in self.members if m[1] <= offset), key=lambda m: m[1])
+        return member[0], offset - member[1]
+
+    def check(self, filename):
+        """
+        Raise ValueError if the file has changed size since it was indexed.
+        """
+
+        if os.path.getsize(filename) != self.size:
+            raise ValueError('Index of {} is out of date.'.format(filename))
+
+    def save(self, path):
+        """
+        Save the index as JSON, e.g. alongside the log it indexes.
+        """
+
+        with open(path, 'w') as index_file:
+            json.dump({'size': self.size, 'members': self.members,
+                       'sections': self.sections}, index_file)
+
+    @staticmethod
+    def load(path):
+        """
+        Load an index saved by SectionIndex.save.
+        """
+
+        with open(path) as index_file:
+            data = json.load(index_file)
+        return SectionIndex(data['size'], data['members'], data['sections'])
+
+    @staticmethod
+    def build(filename):
+        """
+        Index a (possibly compressed) log by reading it once from start to end.
+        """
+
+        scanner = _SectionScanner(SectionIndex.SECTIONS)
+        kind = compression(filename)
+
+        if kind == 'gzip':
+            members = _scan_gzip_members(filename, scanner)
+        else:
+            members = [(0, 0)]
+            opener = open if kind is None else _OPENERS[kind]
+            with opener(filename, 'rb') as stream:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    scanner.feed(chunk)
+
+        return SectionIndex(os.path.getsize(filename), members, scanner.sections)
+
+
+class _SectionScanner:
+    """
+    Finds the first occurrence of each section marker in a stream of bytes,
+    including markers split across chunks.
+    """
+
+    def __init__(self, markers):
+        self.markers = dict((name, marker.encode()) for name, marker in markers.items())
+        self.sections = {}
+        self.position = 0
+        self._tail = b''
+        self._overlap = max(len(marker) for marker in self.markers.values()) - 1
+
+    def feed(self, chunk):
+        data = self._tail + chunk
+        start = self.position - len(self._tail)
+        for name, marker in self.markers.items():
+            if name not in self.sections:
+                found = data.find(marker)
+                if found >= 0:
+                    self.sections[name] = start + found
+        self.position += len(chunk)
+        self._tail = data[-self._overlap:] if self._overlap else b''
+
+
+def _scan_gzip_members(filename, scanner):
+    """
+    Decompress a gzip file member by member, feeding the output to scanner.
+    :returns: (compressed offset, uncompressed offset) of each member.
+    """
+
+    members = []
+    compressed_position = 0
+    decompressor = None
+    pending = b''
+
+    with open(filename, 'rb') as raw:
+        while True:
+            if not pending:
+                pending = raw.read(CHUNK_SIZE)
+                if not pending:
+                    break
+            if decompressor is None:
+                members.append((compressed_position, scanner.position))
+                decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+
+            scanner.feed(decompressor.decompress(pending))
+            unused = decompressor.unused_data
+            compressed_position += len(pending) - len(unused)
+            pending = unused
+
+            if decompressor.eof:
+                decompressor = None
+                # Some writers pad the end of the file with zeros
+                if pending.strip(b'\x00') == b'' and not raw.peek(1):
+                    break
+
+    return members
@@ -7,8 +7,10 @@ Copyright Sean McGrath 2015. Issued under the MIT License.
 """
 
 import re
-from math import sqrt
-from .util import is_numeric, flatten
+from array import array
+from . import fchk
+from .logfile import open_log
+from .util import decode_floats, decode_block, flatten, rms_deviation
 
 
 class DistanceMatrix:
@@ -105,16 +107,34 @@ class DistanceMatrix:
         if self.units != other.units:
             raise ValueError('Matrices to compare must have the same units.')
 
-        if distance_threshold:
-            squared_differences = \
-                [(a - b)**2 for a, b in zip(self.flattened, other.flattened)
-                 if abs(a - b) < distance_threshold]
+        return rms_deviation(self.flattened, other.flattened, distance_threshold)
 
-        else:
-            squared_differences = \
-                [(a - b)**2 for a, b in zip(self.flattened, other.flattened)]
+    @staticmethod
+    def stack(matrices):
+        """
+        Concatenate the flattened values of matrices of the same atoms and
+        units into one array, e.g. for every Configuration of a series.
+        :param matrices: an iterable of DistanceMatrix objects.
+        :returns: (atoms, stride, units, array), where the values of matrix
+        i are at array[i * stride:(i + 1) * stride]. atoms, stride and units
+        are None if there are no matrices.
+        """
 
-        return sqrt(sum(squared_differences) / len(squared_differences))
+        values = array('d')
+        atoms = stride = units = None
+        for matrix in matrices:
+            flattened = matrix.flattened
+            if stride is None:
+                atoms, stride, units = len(matrix), len(flattened), matrix.units
+                if stride not in (atoms * (atoms + 1) // 2, atoms * atoms):
+                    raise ValueError('Distance matrices must be square or lower triangular.')
+            elif len(matrix) != atoms or len(flattened) != stride:
+                raise ValueError('Every distance matrix must have the same atoms.')
+            elif matrix.units != units:
+                raise ValueError('Every distance matrix must have the same units.')
+            values.extend(flattened)
+
+        return atoms, stride, units, values
 
     @staticmethod
     def from_csv(csv_file, units=DEFAULT_UNIT):
@@ -131,38 +151,48 @@ class DistanceMatrix:
                     'Filetype must be .csv to create a DistanceMatrix.')
 
             with open(csv_file, 'r') as open_file:
-                return DistanceMatrix.from_csv(open_file)
-
-        lines = [line.strip().split(',') for line in csv_file.readlines()]
+                return DistanceMatrix.from_csv(open_file, units)
 
-        # Strip trailing empty strings if they exist
-        try:
-            [line.remove('') for line in lines]
-        except ValueError:
-            pass
-
-        highest_line_length = 0
-        matrix = []
-        for line in lines:
-            if len(line) == highest_line_length + 1:
-                if all(is_numeric(item) for item in line):
-                    matrix.append([float(item) for item in line])
-                    highest_line_length += 1
-            else:
+        matrix = decode_block(csv_file, separator=',')
+        for i, row in enumerate(matrix):
+            if len(row) != i + 1:
                 raise ValueError(
                     'Data lines in input file should be in order of ascending length.')
 
         return DistanceMatrix(matrix, units)
 
     @staticmethod
-    def from_log_file(filename):
+    def from_fchk(filename):
+        """
+        Read a Gaussian formatted checkpoint (.fchk) file and create a
+        DistanceMatrix from its cartesian coordinates.
+        :param filename: the path to the .fchk file, which may be compressed.
+        """
+
+        return DistanceMatrix(fchk.distance_matrix(
+            fchk.read_fchk(filename, fchk.MATRIX_LABELS)))
+
+    @staticmethod
+    def from_log_file(filename, index=None):
         """
         Parse a Gaussian .log file and create a DistanceMatrix.
-        :param filename: the path to the .log file
+        :param filename: the path to the .log file, which may be compressed
+        with gzip, xz or bz2.
+        :param index: an optional logfile.SectionIndex of the file, used to
+        skip straight to the distance matrix.
         """
 
-        with open(filename) as open_file:
-            lines = open_file.readlines()
+        section = 'matrix' if index is not None else None
+        with open_log(filename, section, index) as open_file:
+            return DistanceMatrix.from_log_lines(open_file)
+
+    @staticmethod
+    def from_log_lines(lines):
+        """
+        Create a DistanceMatrix from the lines of a Gaussian .log file.
+        :param lines: an iterable of lines, e.g. an open file object.
+        Iteration stops at the end of the first distance matrix.
+        """
 
         # find the distance matrix lines, clean and split them
         split_lines = []
@@ -190,16 +220,23 @@ class DistanceMatrix:
             current_index = int(line[0]) - 1
             if current_index < old_index:
                 column_offset += 5
-            if current_index is 1:
+            if current_index == 1:
                 column_offset = 0
-            while current_column < len(line) - 2:
-                distance = line[current_column + 2]
+            distances = decode_floats(line[2:])
+            while current_column < len(distances):
                 temp_matrix[current_index][
-                    current_column + column_offset] = distance
+                    current_column + column_offset] = distances[current_column]
                 current_column += 1
             old_index = current_index
 
         # Temp matrix has placeholder elements - remove them
-        matrix = [[float(item) for item in row if item] for row in temp_matrix]
+        matrix = [[item for item in row if item is not None] for row in temp_matrix]
+
+        # Row i holds the distances to atoms 1 to i. Rows that did not match
+        # MATRIX_REGEX, e.g. with a malformed value, are short.
+        for number, (row, temp_row) in enumerate(zip(matrix, temp_matrix), 1):
+            if len(row) != number or None in temp_row[:number]:
+                raise ValueError('Expected {} distances in row {} of the distance matrix, found {}.'.format(
+                    number, number, len(row)))
 
         return DistanceMatrix(matrix)
@@ -0,0 +1,201 @@
+"""
+Defines tools for matching normal modes between molecular
+configurations by the overlap of their displacement vectors.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+from math import sqrt
+from operator import mul
+
+
+def _peaks(modes):
+    """
+    Get the list of SpectralPeaks from a PeakAssigner or iterable of peaks.
+    """
+
+    return list(getattr(modes, 'peaks', modes))
+
+
+def unit_vectors(modes):
+    """
+    Normalise the displacement vector of every mode once, so overlaps
+    reduce to dot products.
+    :param modes: a PeakAssigner or an iterable of SpectralPeaks.
+    :returns: a list of tuples, one unit vector per mode.
+    """
+
+    vectors = []
+    for peak in _peaks(modes):
+        vector = peak.displacements
+        norm = sqrt(sum(map(mul, vector, vector)))
+        vectors.append(tuple(component / norm for component in vector) if norm else tuple(vector))
+    return vectors
+
+
+def overlap_matrix(modes_a, modes_b):
+    """
+    Compute the overlap of every mode in one configuration with every
+    mode in another: the absolute cosine of the angle between their
+    displacement vectors, from 0 (orthogonal) to 1 (identical).
+    :param modes_a: a PeakAssigner, iterable of SpectralPeaks, or the
+    result of unit_vectors.
+    :param modes_b: as modes_a.
+    :returns: a list of rows; row k holds the overlaps of mode k of a.
+    """
+
+    vectors_a = _as_unit_vectors(modes_a)
+    vectors_b = _as_unit_vectors(modes_b)
+    if len(set(len(vector) for vector in vectors_a + vectors_b)) > 1:
+        raise ValueError('Configurations must have the same number of atoms.')
+
+    return [[abs(sum(map(mul, a, b))) for b in vectors_b] for a in vectors_a]
+
+
+def _as_unit_vectors(modes):
+    modes = modes if isinstance(modes, list) else _peaks(modes)
+    if modes and isinstance(modes[0], tuple):
+        return modes
+    return unit_vectors(modes)
+
+
+def optimal_assignment(cost):
+    """
+    Solve the assignment problem by the Hungarian algorithm: pair each
+    row with a distinct column so that the total cost is minimal.
+    :param cost: a list of rows of costs. May be rectangular.
+    :returns: a list giving the assigned column of each row, or None
+    for rows left unassigned when there are more rows than columns.
+    """
+
+    rows = len(cost)
+    columns = len(cost[0]) if rows else 0
+    if rows > columns:
+        transposed = optimal_assignment([list(column) for column in zip(*cost)])
+        assignment = [None] * rows
+        for column, row in enumerate(transposed):
+            assignment[row] = column
+        return assignment
+
+    # Potentials, matched row of each column, and the alternating path,
+    # with index 0 a virtual column used to start each augmentation.
+    infinity = float('inf')
+    row_potential = [0.0] * (rows + 1)
+    column_potential = [0.0] * (columns + 1)
+    matched_row = [0] * (columns + 1)
+    previous = [0] * (columns + 1)
+
+    for row in range(1, rows + 1):
+        matched_row[0] = row
+        column = 0
+        minimum = [infinity] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            current_row = matched_row[column]
+            current_cost = cost[current_row - 1]
+            delta, next_column = infinity, 0
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    reduced = current_cost[j - 1] - row_potential[current_row] - column_potential[j]
+                    if reduced < minimum[j]:
+                        minimum[j], previous[j] = reduced, column
+                    if minimum[j] < delta:
+                        delta, next_column = minimum[j], j
+            for j in range(columns + 1):
+                if used[j]:
+                    row_potential[matched_row[j]] += delta
+                    column_potential[j] -= delta
+                else:
+                    minimum[j] -= delta
+            column = next_column
+            if matched_row[column] == 0:
+                break
+
+        # Flip the matching along the augmenting path
+        while column:
+            prior = previous[column]
+            matched_row[column] = matched_row[prior]
+            column = prior
+
+    assignment = [None] * rows
+    for j in range(1, columns + 1):
+        if matched_row[j]:
+            assignment[matched_row[j] - 1] = j - 1
+    return assignment
+
+
+def match_modes(modes_a, modes_b):
+    """
+    Find the mode of configuration b corresponding to each mode of
+    configuration a, maximising the total displacement overlap.
+    :returns: (assignment, overlaps), where assignment[k] is the index in b
+    matched to mode k of a (or None) and overlaps[k] is their overlap.
+    """
+
+    overlaps = overlap_matrix(modes_a, modes_b)
+    assignment = optimal_assignment([[1 - overlap for overlap in row] for row in overlaps])
+    return assignment, [row[j] if j is not None else 0.0
+                        for row, j in zip(overlaps, assignment)]
+
+
+class ModeTracker:
+    """
+    Follows each normal mode of a reference configuration through a
+    sequence of configurations, e.g. the frames of a Trajectory.
+
+    Modes are matched between consecutive frames rather than against the
+    reference, so that gradual changes in mode character are followed.
+    """
+
+    def __init__(self, frames):
+        """
+        Constructor. Matches the modes of every consecutive pair of frames.
+        :param frames: an iterable of PeakAssigners or lists of SpectralPeaks,
+        in order.
+        """
+
+        self.frames = [_peaks(frame) for frame in frames]
+        if not self.frames:
+            raise ValueError('There must be at least one frame to track.')
+
+        # indices[f][k] is the index in frame f of reference mode k
+        reference = list(range(len(self.frames[0])))
+        self.indices = [reference]
+        self.overlaps = [[1.0] * len(reference)]
+
+        previous_vectors = unit_vectors(self.frames[0])
+        for frame in self.frames[1:]:
+            vectors = unit_vectors(frame)
+            assignment, overlaps = match_modes(previous_vectors, vectors)
+            # Compose with the previous frame's matching to get back to the reference
+            last = self.indices[-1]
+            self.indices.append([assignment[index] if index is not None else None
+                                 for index in last])
+            self.overlaps.append([overlaps[index] if index is not None else 0.0
+                                  for index in last])
+            previous_vectors = vectors
+
+    def __len__(self):
+        return len(self.frames)
+
+    def peaks(self, mode):
+        """
+        The SpectralPeak of a reference mode in every frame, or None in
+        frames where it could not be matched.
+        :param mode: index of the mode in the first frame.
+        """
+
+        return [frame[indices[mode]] if indices[mode] is not None else None
+                for frame, indices in zip(self.frames, self.indices)]
+
+    def frequencies(self, mode):
+        """
+        The frequency of a reference mode in every frame, or None in frames
+        where it could not be matched.
+        :param mode: index of the mode in the first frame.
+        """
+
+        return [peak.frequency if peak is not None else None for peak in self.peaks(mode)]
@@ -0,0 +1,270 @@
+"""
+Defines tools for plotting many spectra at once: peak-preserving
+downsampling of curves to the resolution of the plot, and percentile
+bands summarising large ensembles.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+from collections import OrderedDict
+
+from .collection import SpectrumCollection
+from .util import linspace
+
+
+def lttb(x_values, y_values, threshold):
+    """
+    Downsample a curve by Largest-Triangle-Three-Buckets: keep the first
+    and last points and, from each of threshold - 2 buckets between them,
+    the point forming the largest triangle with the previous kept point
+    and the average of the next bucket. Peaks are kept as they form
+    large triangles.
+    :param x_values: increasing x values of the curve.
+    :param y_values: the y value at each x value.
+    :param threshold: the number of points to keep, at least 3.
+    :returns: (x values, y values) of the kept points.
+    """
+
+    count = len(x_values)
+    if threshold < 3:
+        raise ValueError('LTTB must keep at least 3 points.')
+    if threshold >= count:
+        return list(x_values), list(y_values)
+
+    every = (count - 2) / (threshold - 2)
+    kept = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        # Average of the next bucket (the last point for the last bucket)
+        next_start = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, count)
+        average_x = sum(x_values[next_start:next_end]) / (next_end - next_start)
+        average_y = sum(y_values[next_start:next_end]) / (next_end - next_start)
+
+        previous_x, previous_y = x_values[previous], y_values[previous]
+        best, best_area = None, -1
+        for i in range(int(bucket * every) + 1, next_start):
+            # Twice the triangle's area; the factor makes no difference
+            area = abs((previous_x - average_x) * (y_values[i] - previous_y)
+                       - (previous_x - x_values[i]) * (average_y - previous_y))
+            if area > best_area:
+                best, best_area = i, area
+        kept.append(best)
+        previous = best
+    kept.append(count - 1)
+
+    return [x_values[i] for i in kept], [y_values[i] for i in kept]
+
+
+def _columns(x_values, x_min, x_max, columns):
+    """
+    Generate the (start, end) indices of the points of increasing
+    x_values falling in each of columns equal width columns of the range
+    x_min to x_max. Empty columns are skipped.
+    """
+
+    width = (x_max - x_min) / columns if x_max > x_min else 1
+    start = 0
+    while start < len(x_values):
+        column = min(int((x_values[start] - x_min) / width), columns - 1)
+        end = start + 1
+        while end < len(x_values) and min(int((x_values[end] - x_min) / width), columns - 1) == column:
+            end += 1
+        yield start, end
+        start = end
+
+
+def min_max_envelope(x_values, y_values, columns):
+    """
+    Downsample a curve to the lowest and highest point in each of columns
+    equal width columns of its x range, e.g. one per pixel, so that
+    every peak and trough visible at that resolution is kept.
+    :param x_values: increasing x values of the curve.
+    :param y_values: the y value at each x value.
+    :param columns: the number of columns.
+    :returns: (x values, y values) of at most 2 * columns points, in order.
+    """
+
+    if columns < 1:
+        raise ValueError('There must be at least one column.')
+    if len(x_values) <= 2 * columns:
+        return list(x_values), list(y_values)
+
+    kept = []
+    for start, end in _columns(x_values, x_values[0], x_values[-1], columns):
+        low = min(range(start, end), key=y_values.__getitem__)
+        high = max(range(start, end), key=y_values.__getitem__)
+        kept.extend(sorted({low, high}))
+
+    return [x_values[i] for i in kept], [y_values[i] for i in kept]
+
+
+def percentile(sorted_values, fraction):
+    """
+    Interpolate linearly between the closest ranks of sorted values.
+    :param fraction: from 0 (the lowest value) to 1 (the highest).
+    """
+
+    position = fraction * (len(sorted_values) - 1)
+    lower = int(position)
+    if lower + 1 >= len(sorted_values):
+        return sorted_values[-1]
+    return sorted_values[lower] + (position - lower) * (sorted_values[lower + 1] - sorted_values[lower])
+
+
+DOWNSAMPLERS = {
+    'minmax': lambda x_values, y_values, pixels: min_max_envelope(x_values, y_values, pixels),
+    'lttb': lambda x_values, y_values, pixels: lttb(x_values, y_values, max(2 * pixels, 3)),
+}
+
+
+class SpectrumPlotter:
+    """
+    Plots the lorentzian fits of a SpectrumCollection at the resolution
+    of the axis, rather than at Spectrum.NUMBER_OF_POINTS each.
+
+    Each fit is evaluated at OVERSAMPLING points per pixel column and then
+    downsampled to about two points per column. With more than max_lines
+    spectra, percentile bands and the median are drawn instead of every
+    line. Downsampled curves are cached for each x range and width.
+    """
+
+    # Points per pixel column at which fits are evaluated.
+    OVERSAMPLING = 4
+
+    # Width in pixels assumed for axes that cannot report their size.
+    DEFAULT_PIXELS = 1000
+
+    # Percentiles bounding the nested bands drawn for large collections.
+    BANDS = ((5, 95), (25, 75))
+
+    # Number of x ranges kept in the cache.
+    CACHE_SIZE = 8
+
+    def __init__(self, spectra, max_lines=50, method='minmax'):
+        """
+        Constructor.
+        :param spectra: a SpectrumCollection, or an iterable of Spectrum objects.
+        :param max_lines: the most spectra drawn as individual lines.
+        :param method: the downsampling method, 'minmax' or 'lttb'.
+        """
+
+        if method not in DOWNSAMPLERS:
+            raise ValueError('method must be one of ' + str(tuple(DOWNSAMPLERS)))
+        if not isinstance(spectra, SpectrumCollection):
+            spectra = SpectrumCollection(spectra)
+        self.collection = spectra
+        self.max_lines = max_lines
+        self.method = method
+        self._cache = OrderedDict()
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def _cached(self, key, compute):
+        # Spectra appended to the collection change its length
+        key = (len(self.collection),) + key
+        if key in self._cache:
+            self._cache.move_to_end(key)
+        else:
+            self._cache[key] = compute()
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return self._cache[key]
+
+    def _grid(self, x_min, x_max, pixels):
+        if x_min is None or x_max is None:
+            x_array = self.collection.x_array()
+            x_min = x_array[0] if x_min is None else x_min
+            x_max = x_array[-1] if x_max is None else x_max
+        return x_min, x_max, linspace(x_min, x_max, pixels * self.OVERSAMPLING)
+
+    def lines(self, x_min=None, x_max=None, pixels=DEFAULT_PIXELS):
+        """
+        Evaluate and downsample the fit of every spectrum.
+        :param x_min: lowest x value, defaults to the lowest frequency.
+        :param x_max: highest x value, defaults to the highest frequency.
+        :param pixels: the width of the plot in pixels.
+        :returns: a list of (x values, y values), one per spectrum.
+        """
+
+        x_min, x_max, x_array = self._grid(x_min, x_max, pixels)
+
+        def compute():
+            downsample = DOWNSAMPLERS[self.method]
+            return [downsample(x_array, row, pixels)
+                    for rows in self.collection.iter_evaluate(x_array) for row in rows]
+
+        return self._cached(('lines', self.method, x_min, x_max, pixels), compute)
+
+    def bands(self, x_min=None, x_max=None, pixels=DEFAULT_PIXELS, bands=BANDS):
+        """
+        Compute percentile bands of the fits across the collection.
+        :param x_min, x_max, pixels: as for lines.
+        :param bands: (lower, upper) percentile pairs.
+        :returns: (x values, median, list of (lower, upper) values per band).
+        Each band is widened to its extremes within each pixel column, so
+        that narrow peaks are not lost.
+        """
+
+        x_min, x_max, x_array = self._grid(x_min, x_max, pixels)
+        if not len(self.collection):
+            raise ValueError('Cannot compute bands of an empty collection.')
+
+        def compute():
+            fractions = [0.5] + [p / 100 for band in bands for p in band]
+            curves = [[] for _ in fractions]
+
+            # Evaluate every spectrum over one slice of the grid at a time,
+            # so only the slice is held for all spectra at once
+            slice_size = SpectrumCollection.CHUNK_SIZE
+            for start in range(0, len(x_array), slice_size):
+                rows = self.collection.evaluate(x_array[start:start + slice_size])
+                for values in zip(*rows):
+                    values = sorted(values)
+                    for curve, fraction in zip(curves, fractions):
+                        curve.append(percentile(values, fraction))
+
+            centres, median, edges = [], [], [([], []) for _ in bands]
+            for start, end in _columns(x_array, x_min, x_max, pixels):
+                centres.append(sum(x_array[start:end]) / (end - start))
+                median.append(max(curves[0][start:end]))
+                for i, (lower, upper) in enumerate(edges):
+                    lower.append(min(curves[2 * i + 1][start:end]))
+                    upper.append(max(curves[2 * i + 2][start:end]))
+            return centres, median, edges
+
+        return self._cached(('bands', tuple(bands), x_min, x_max, pixels), compute)
+
+    def plot(self, axis, x_min=None, x_max=None, pixels=None, **kwargs):
+        """
+        Plot the collection: every spectrum as a line if there are at most
+        max_lines, and otherwise the median and percentile bands.
+        :param axis: a matplotlib axis object on which to plot.
+        :param x_min, x_max: as for lines.
+        :param pixels: the width of the plot in pixels, by default the width
+        of the axis.
+        :param kwargs: keyword arguments to be passed to matplotlib.Axis.plot
+        """
+
+        if pixels is None:
+            pixels = self._axis_pixels(axis)
+
+        if len(self.collection) <= self.max_lines:
+            for x_values, y_values in self.lines(x_min, x_max, pixels):
+                axis.plot(x_values, y_values, **kwargs)
+            return
+
+        x_values, median, edges = self.bands(x_min, x_max, pixels)
+        line = axis.plot(x_values, median, **kwargs)
+        color = line[0].get_color() if line else None
+        for i, (lower, upper) in enumerate(edges):
+            axis.fill_between(x_values, lower, upper, color=color, alpha=0.2 * (i + 1), linewidth=0)
+
+    def _axis_pixels(self, axis):
+        try:
+            return max(int(axis.get_window_extent().width), 1)
+        except AttributeError:
+            return self.DEFAULT_PIXELS
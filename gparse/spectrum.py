@@ -10,13 +10,10 @@ import math
 import os
 import datetime
 
-try:
-    import markdown
-except:
-    markdown = None
-
 from functools import partial
-from .util import linspace, is_numeric, integrate, flatten
+from . import fchk
+from .logfile import open_log
+from .util import linspace, adaptive_space, decode_floats, integrate, integrate_gauss
 
 
 def lorentzian(x_value, amplitude, center, width):
@@ -29,6 +26,52 @@ def lorentzian(x_value, amplitude, center, width):
     return amplitude * (numerator / denominator)
 
 
+# Canonical name of each accepted type of spectrum.
+SPECTRUM_TYPES = {'r': 'raman', 'raman': 'raman', 'ir': 'ir', 'infrared': 'ir'}
+
+
+def spectrum_type(type):
+    """
+    Get the canonical name, 'raman' or 'ir', of a type of spectrum.
+    :param type: 'raman' or 'r' for a raman spectrum, 'ir' or 'infrared'
+    for an infrared spectrum
+    """
+
+    if type not in SPECTRUM_TYPES:
+        raise ValueError("type must be r, ir, raman, or infrared")
+    return SPECTRUM_TYPES[type]
+
+
+def spectrum_attribute(type):
+    """
+    Get the Configuration attribute holding a type of spectrum,
+    'raman_spectrum' or 'ir_spectrum'.
+    """
+
+    return spectrum_type(type) + '_spectrum'
+
+
+def is_property_line(line, label):
+    """
+    Check whether a line of a .log file gives the values of a normal mode
+    property, e.g. ' Frequencies --  1.0  2.0' for the label 'Frequencies',
+    rather than merely mentioning the label, as a job title might.
+    """
+
+    line = line.lstrip()
+    return line.startswith(label) and line[len(label):].lstrip().startswith('--')
+
+
+def property_values(line, line_number=None):
+    """
+    Parse the values of a normal mode property line,
+    e.g. ' Red. masses --  1.0829  1.0454'.
+    :param line_number: line of the file the line is, for error messages.
+    """
+
+    return decode_floats(line.rpartition('--')[2].split(), line_number)
+
+
 class Spectrum:
     """
     Class to represent one vibrational spectrum.
@@ -42,6 +85,14 @@ class Spectrum:
     # Default width of lorentzians fitted to the data.
     LORENTZIAN_WIDTH = 3.3
 
+    # Default error tolerance of adaptive x arrays, relative to the
+    # highest intensity in the spectrum.
+    ADAPTIVE_TOLERANCE = 1e-3
+
+    # Distances from each peak, in lorentzian widths, of the initial
+    # points of adaptive x arrays.
+    ADAPTIVE_SEED_WIDTHS = (1,)
+
     def __init__(self, frequencies, intensities, width=LORENTZIAN_WIDTH):
         """
         Constructor.
@@ -96,31 +147,60 @@ class Spectrum:
         """
         return self._fit_function
 
-    def x_array(self, x_min=None, x_max=None, points=NUMBER_OF_POINTS):
+    def x_array(self, x_min=None, x_max=None, points=NUMBER_OF_POINTS,
+                adaptive=False, tolerance=ADAPTIVE_TOLERANCE):
         """
         Compute an array of values needed for plotting the
         x-axis of a spectrum.
+        :param x_min: lowest x value, defaults to the lowest frequency.
+        :param x_max: highest x value, defaults to the highest frequency.
+        :param points: number of evenly spaced points, if not adaptive.
+        :param adaptive: place points densely around peaks and sparsely
+        elsewhere, rather than spacing them evenly.
+        :param tolerance: for adaptive arrays, the largest allowed error from
+        linear interpolation between points, as a fraction of the highest
+        intensity.
         """
-        x_min = x_min or min(self.frequencies)
-        x_max = x_max or max(self.frequencies)
-        return linspace(min(self.frequencies), max(self.frequencies), points)
-
-    def as_list(self, points=NUMBER_OF_POINTS):
+        x_min = min(self.frequencies) if x_min is None else x_min
+        x_max = max(self.frequencies) if x_max is None else x_max
+        if not adaptive:
+            return linspace(x_min, x_max, points)
+
+        # Seed each peak with points at widening distances from its centre
+        # so that no peak is stepped over before bisection starts.
+        seeds = []
+        for frequency in self.frequencies:
+            seeds.append(frequency)
+            for multiple in self.ADAPTIVE_SEED_WIDTHS:
+                offset = multiple * self.lorentzian_width
+                seeds.extend((frequency - offset, frequency + offset))
+
+        absolute_tolerance = tolerance * max(abs(i) for i in self.intensities)
+        return adaptive_space(self.fit_function, x_min, x_max,
+                              seeds, absolute_tolerance or tolerance)
+
+    def as_list(self, points=NUMBER_OF_POINTS, x_min=None, x_max=None,
+                adaptive=False, tolerance=ADAPTIVE_TOLERANCE):
         """
         Constructs a sum of lorentzians about the spectral points,
         and evaluates it at the given number of points.
+        Takes the same arguments as x_array.
         """
 
-        return [self.fit_function(x) for x in self.x_array(points)]
+        return [self.fit_function(x)
+                for x in self.x_array(x_min, x_max, points, adaptive, tolerance)]
 
-    def plot(self, axis, points=NUMBER_OF_POINTS, stems=False, **kwargs):
+    def plot(self, axis, points=NUMBER_OF_POINTS, stems=False, x_min=None,
+             x_max=None, adaptive=False, tolerance=ADAPTIVE_TOLERANCE, **kwargs):
         """
         Plot the lorentzian representation of the spectrum.
         l:param ax: a matplotlib axis object on which to plot.
+        :param x_min, x_max, adaptive, tolerance: as for x_array.
         :param kwargs: keyword arguments to be passed to matplotlib.Axis.plot
         """
 
-        axis.plot(self.x_array(points), self.as_list(points), **kwargs)
+        x_array = self.x_array(x_min, x_max, points, adaptive, tolerance)
+        axis.plot(x_array, [self.fit_function(x) for x in x_array], **kwargs)
         if stems:
             axis.stem(self.frequencies, self.intensities, markerfmt=' ')
 
@@ -132,13 +212,27 @@ class Spectrum:
         return Spectrum(self.frequencies, self.intensities, self.lorentzian_width)
 
     @property
-    def integral(self, points=NUMBER_OF_POINTS):
+    def integral(self):
+        """
+        Compute the numeric integral of the lorentzian fit to the spectrum
+        over NUMBER_OF_POINTS evenly spaced points.
+        """
+
+        return self.integral_over()
+
+    def integral_over(self, x_min=None, x_max=None, points=NUMBER_OF_POINTS,
+                      adaptive=False, tolerance=ADAPTIVE_TOLERANCE):
         """
         Compute the numeric integral of the lorentzian fit to the spectrum.
-        :param points: number of points to integrate over.
+        Takes the same arguments as x_array. Adaptive x arrays have long
+        intervals away from peaks, so are integrated by a Gauss-Legendre
+        rule on each interval rather than the midpoint rule.
         """
 
-        return integrate(self.x_array(points), self.as_list(points))
+        x_array = self.x_array(x_min, x_max, points, adaptive, tolerance)
+        if adaptive:
+            return integrate_gauss(self.fit_function, x_array)
+        return integrate(x_array, [self.fit_function(x) for x in x_array])
 
     @staticmethod
     def from_csv(csv_file, width=LORENTZIAN_WIDTH):
@@ -152,44 +246,85 @@ class Spectrum:
             raise ValueError('Filetype must be .csv to create a Spectrum.')
 
         with open(csv_file, 'r') as open_file:
-            lines = [line.strip().split(',') for line in open_file.readlines()]
-
             frequencies, intensities = [], []
-            for line in lines:
-                if len(line) > 1 and is_numeric(line[0]) and is_numeric(line[1]):
-                    frequencies.append(float(line[0]))
-                    intensities.append(float(line[1]))
+            for line_number, line in enumerate(open_file, 1):
+                fields = line.strip().split(',')
+                if len(fields) < 2:
+                    continue
+                try:
+                    frequency, intensity = decode_floats(fields[:2], line_number)
+                except ValueError:
+                    # Header lines may precede the data, but not follow it
+                    if frequencies:
+                        raise
+                    continue
+                frequencies.append(frequency)
+                intensities.append(intensity)
 
             return Spectrum(frequencies, intensities, width)
 
     @staticmethod
-    def from_log_file(filename, type='raman', width=LORENTZIAN_WIDTH):
+    def from_fchk(filename, type='raman', width=LORENTZIAN_WIDTH):
+        """
+        Read a Gaussian formatted checkpoint (.fchk) file and create a Spectrum.
+        :param filename: the path to the .fchk file, which may be compressed.
+        :param type: 'raman' or 'r' for a raman spectrum, 'ir' or 'infrared'
+        for an infrared spectrum
+        """
+
+        values = fchk.read_fchk(filename, fchk.SPECTRUM_LABELS)
+        return Spectrum.from_fchk_values(values, type, width)
+
+    @staticmethod
+    def from_fchk_values(values, type='raman', width=LORENTZIAN_WIDTH):
+        """
+        Create a Spectrum from the values of a .fchk file.
+        :param values: a dict from fchk.read_fchk including fchk.SPECTRUM_LABELS.
+        :param type: 'raman' or 'r' for a raman spectrum, 'ir' or 'infrared'
+        for an infrared spectrum
+        """
+
+        modes = fchk.vibrations(values)
+        field = {'raman': 'raman_activity', 'ir': 'ir_intensity'}[spectrum_type(type)]
+
+        if field not in modes:
+            raise ValueError('The .fchk file has no {} data.'.format(type))
+        return Spectrum(modes['frequency'], modes[field], width)
+
+    @staticmethod
+    def from_log_file(filename, type='raman', width=LORENTZIAN_WIDTH, index=None):
         """
         Parse a Gaussian .log file and create a Spectrum.
-        :param filename: the path to the .log file
+        :param filename: the path to the .log file, which may be compressed
+        with gzip, xz or bz2.
         :param type: 'raman' or 'r' for a raman spectrum, 'ir' or 'infrared'
         for an infrared spectrum
+        :param index: an optional logfile.SectionIndex of the file, used to
+        skip straight to the frequency section.
         """
 
-        def _parse_line(line):
-            """
-            Parse the numbers from a line.
-            """
-            return [float(item) for item in line.split() if is_numeric(item)]
+        section = 'frequencies' if index is not None else None
+        with open_log(filename, section, index) as open_file:
+            return Spectrum.from_log_lines(open_file, type, width)
 
-        with open(filename) as open_file:
-            lines = open_file.readlines()
+    @staticmethod
+    def from_log_lines(lines, type='raman', width=LORENTZIAN_WIDTH, first_line=1):
+        """
+        Create a Spectrum from the lines of a Gaussian .log file.
+        :param lines: an iterable of lines, e.g. an open file object.
+        :param type: 'raman' or 'r' for a raman spectrum, 'ir' or 'infrared'
+        for an infrared spectrum
+        :param first_line: line number of the first line, for error messages.
+        """
 
-        frequencies = flatten([_parse_line(line.strip())
-                               for line in lines if 'Frequencies' in line])
-        if type in ('r', 'raman'):
-            intensities = flatten([_parse_line(line.strip())
-                                   for line in lines if 'Raman Activ' in line])
-        elif type in ('ir', 'infrared'):
-            intensities = flatten([_parse_line(line.strip())
-                                   for line in lines if 'IR Inten' in line])
-        else:
-            raise ValueError("type must be r, ir, raman, or infrared")
+        intensity_label = {'raman': 'Raman Activ', 'ir': 'IR Inten'}[spectrum_type(type)]
+
+        frequencies, intensities = [], []
+        for line_number, line in enumerate(lines, first_line):
+            if is_property_line(line, 'Frequencies'):
+                frequencies.extend(property_values(line, line_number))
+            elif is_property_line(line, intensity_label):
+                intensities.extend(property_values(line, line_number))
 
         return Spectrum(frequencies, intensities, width)
 
@@ -231,6 +366,14 @@ class SpectralPeak:
     def __repr__(self):
         return 'Peak #{}: {} 1/cm'.format(self.number, self.frequency)
 
+    @property
+    def displacements(self):
+        """
+        The displacement vector of the mode: x, y and z of each atom in turn.
+        """
+
+        return [component for atom in self.atoms for component in (atom.x, atom.y, atom.z)]
+
     def assign(self, heavy_only=False):
         return list(filter(lambda x: x.eigen_sum != 0 and (x.element > 1 or heavy_only is False),
                            sorted(self.atoms, key=lambda x: x.eigen_sum)[::-1]))
@@ -266,23 +409,118 @@ class Atom:
 
 class PeakAssigner:
 
-    def __init__(self, log_file, heavy_only=False):
+    # Labels of the normal mode property lines of a .log file, and the
+    # SpectralPeak argument each gives.
+    PROPERTY_LABELS = (
+        ('Frequencies', 'frequency'),
+        ('Red. masses', 'reduced_mass'),
+        ('Frc consts', 'frc_const'),
+        ('IR Inten', 'ir_intensity'),
+        ('Raman Activ', 'raman_activity'),
+        ('Depolar (P)', 'depolar_p'),
+        ('Depolar (U)', 'depolar_u'),
+    )
+
+    def __init__(self, log_file, heavy_only=False, index=None):
+        """
+        Constructor.
+        :param log_file: path to a Gaussian .log file, which may be
+        compressed with gzip, xz or bz2.
+        :param heavy_only: only report assignments to non-hydrogen atoms.
+        :param index: an optional logfile.SectionIndex of the file, used to
+        skip straight to the frequency section.
+        """
+
+        self._setup(heavy_only)
+
+        section = 'frequencies' if index is not None else None
+        with open_log(log_file, section, index) as f:
+            self._find_modes(f)
+
+        while not self.done:
+            self.make_peaks()
+
+    @staticmethod
+    def from_log_lines(lines, heavy_only=False, first_line=1):
+        """
+        Create a PeakAssigner from the lines of a Gaussian .log file.
+        :param lines: an iterable of lines, e.g. an open file object.
+        :param heavy_only: only report assignments to non-hydrogen atoms.
+        :param first_line: line number of the first line, for error messages.
+        """
+
+        assigner = PeakAssigner.__new__(PeakAssigner)
+        assigner._setup(heavy_only)
+        assigner._find_modes(lines, first_line)
+
+        while not assigner.done:
+            assigner.make_peaks()
+        return assigner
+
+    @staticmethod
+    def from_fchk(fchk_file, heavy_only=False):
+        """
+        Create a PeakAssigner from a Gaussian formatted checkpoint (.fchk) file.
+        :param fchk_file: path to the .fchk file, which may be compressed.
+        :param heavy_only: only report assignments to non-hydrogen atoms.
+        """
+
+        values = fchk.read_fchk(fchk_file, fchk.MODE_LABELS)
+        return PeakAssigner.from_fchk_values(values, heavy_only)
+
+    @staticmethod
+    def from_fchk_values(values, heavy_only=False):
+        """
+        Create a PeakAssigner from the values of a .fchk file.
+        :param values: a dict from fchk.read_fchk including fchk.MODE_LABELS.
+        :param heavy_only: only report assignments to non-hydrogen atoms.
+        """
 
+        properties = fchk.vibrations(values)
+        peaks = []
+        for number, atoms in enumerate(fchk.normal_modes(values), 1):
+            peak = SpectralPeak(number, *[properties[field][number - 1] if field in properties
+                                          else None for field in fchk.VIB_E2_FIELDS])
+            peak.atoms = [Atom(atom_number, element, x, y, z)
+                          for atom_number, (element, x, y, z) in enumerate(atoms, 1)]
+            peaks.append(peak)
+        return PeakAssigner.from_peaks(peaks, heavy_only)
+
+    @staticmethod
+    def from_peaks(peaks, heavy_only=False):
+        """
+        Create a PeakAssigner holding SpectralPeaks that are already parsed.
+        :param peaks: an iterable of SpectralPeaks with their atoms.
+        :param heavy_only: only report assignments to non-hydrogen atoms.
+        """
+
+        assigner = PeakAssigner.__new__(PeakAssigner)
+        assigner._setup(heavy_only)
+        assigner.peaks = list(peaks)
+        return assigner
+
+    def _find_modes(self, lines, first_line=1):
+        # Skip to the normal mode section and keep only the rest
+        lines = iter(lines)
+        for line_number, line in enumerate(lines, first_line):
+            if 'and normal coordinates:' in line:
+                self.lines = [line] + list(lines)
+                self.first_line = line_number
+                self.index = 1
+                self.done = False
+                break
+
+    def _setup(self, heavy_only):
         self.peaks = []
         self.index = 0
         self.heavy_only = heavy_only
-        self.done = False
+        self.lines = []
 
-        with open(log_file) as f:
-            self.lines = f.readlines()
+        # Line number in the log of the first retained line, for error messages
+        self.first_line = 1
 
-        for i in range(len(self.lines)):
-            if 'and normal coordinates:' in self.lines[i]:
-                self.index = i + 1
-                break
-
-        while not self.done:
-            self.make_peaks()
+        # Logs without a normal mode section have no peaks to assign
+        self.done = True
 
     def __repr__(self):
 
@@ -296,45 +534,81 @@ class PeakAssigner:
         return out
 
     @staticmethod
-    def parse_floats(line):
-        floats = []
-        for el in line.split():
-            try:
-                f = float(el)
-                floats.append(f)
-            except:
-                pass
+    def parse_floats(line, line_number=None):
+        """
+        Parse the values of a normal mode property line,
+        e.g. ' Red. masses --  1.0829  1.0454'.
+        """
 
-        return floats
+        return property_values(line, line_number)
 
     def make_peaks(self):
+        """
+        Parse the block of normal modes starting at self.index.
+        If the log ends part way through the block (e.g. the job is still
+        running) the partial block is discarded and parsing is finished.
+        """
+
+        number_of_peaks = len(self.peaks)
+        try:
+            self._parse_block()
+        except (IndexError, ValueError):
+            # Only a block that runs off the end of the log, or into a last
+            # line still being written, is truncated: anything else is malformed
+            if not self._truncated():
+                raise
+            del self.peaks[number_of_peaks:]
+            self.done = True
+
+    @property
+    def line_number(self):
+        """
+        Line number in the log of the line at self.index.
+        """
 
-        peak_props = [[int(el) for el in self.lines[self.index].split()]]
+        return self.first_line + self.index
+
+    def _truncated(self):
+        if self.index >= len(self.lines):
+            return True
+        return self.index == len(self.lines) - 1 and not self.lines[-1].endswith('\n')
+
+    def _parse_block(self):
+
+        numbers = [int(el) for el in self.lines[self.index].split()]
         self.index += 2
 
+        # Which properties are printed depends on the job, e.g. there are
+        # no raman activities without raman, so match them by label
+        properties = {}
         while 'Atom' not in self.lines[self.index]:
-            peak_props.append(self.parse_floats(self.lines[self.index]))
+            line = self.lines[self.index]
+            for label, field in self.PROPERTY_LABELS:
+                if is_property_line(line, label):
+                    properties[field] = self.parse_floats(line, self.line_number)
             self.index += 1
 
-        prop_zip = list(zip(*peak_props))
-        for props in prop_zip:
-            self.peaks.append(SpectralPeak(*props))
+        for i, number in enumerate(numbers):
+            self.peaks.append(SpectralPeak(number, **dict(
+                (field, properties[field][i] if field in properties else None)
+                for _, field in self.PROPERTY_LABELS)))
 
         self.index += 1
         while not self.lines[self.index].startswith('        '):
             line = self.lines[self.index]
-            if line is '\n':
+            if not line.strip():
                 self.done = True
                 break
             split_line = line.split()
-            new_atoms = []
             number = int(split_line[0])
             element = int(split_line[1])
-            for i in range(len(prop_zip)):
-                x = float(split_line[2 + i * 3])
-                y = float(split_line[3 + i * 3])
-                z = float(split_line[4 + i * 3])
-                self.peaks[-(len(prop_zip) - i)
+            displacements = decode_floats(split_line[2:], self.line_number, 3)
+            if len(displacements) != 3 * len(numbers):
+                raise ValueError('Expected {} displacements on line {}, found {}.'.format(
+                    3 * len(numbers), self.line_number, len(displacements)))
+            for i in range(len(numbers)):
+                x, y, z = displacements[3 * i:3 * i + 3]
+                self.peaks[-(len(numbers) - i)
                            ].atoms.append(Atom(number, element, x, y, z))
             self.index += 1
 
@@ -407,6 +681,13 @@ class PeakReporter:
                         atom.number, atom.el_name, atom.eigen_sum))
                 outfile.write('\n')
 
+        # markdown is optional and slow to import, so only load it when
+        # a report is actually written.
+        try:
+            import markdown
+        except ImportError:
+            markdown = None
+
         if markdown:
             with open('report.md') as md_file:
                 text = md_file.read()
@@ -0,0 +1,273 @@
+"""
+Defines tools for following Gaussian .log files while the job
+that produces them is still running.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+import asyncio
+import codecs
+import os
+from collections import namedtuple
+
+from .spectrum import Spectrum, is_property_line
+from .matrix import DistanceMatrix
+from .configuration import Configuration
+
+
+# A parsed object emitted once its section of a log is complete.
+# kind is one of 'matrix', 'raman', 'ir' or 'configuration', or 'error'
+# with the exception as the value when watch_logs cannot follow a log.
+LogEvent = namedtuple('LogEvent', ['filename', 'kind', 'value'])
+
+
+class LogParser:
+    """
+    Resumable parser for a Gaussian .log file that is still being written.
+
+    Text is fed in as it is appended to the log, and parsed objects are
+    returned as soon as the section they come from is complete. Incomplete
+    lines are held back until the rest of the line arrives.
+    A 'matrix' event is returned for every distance matrix in the log, and
+    the Configuration is given the last one before the frequency section.
+    """
+
+    # Marks the end of the vibrational analysis section of a log.
+    FREQUENCY_SECTION_END = 'Thermochemistry'
+
+    # Marks the start of each distance matrix.
+    MATRIX_START = 'Distance matrix'
+
+    # Labels of the property lines the spectra are built from.
+    FREQUENCY_LABELS = ('Frequencies', 'Raman Activ', 'IR Inten')
+
+    # Marks the end of each step of a job. Compound jobs, e.g. opt freq,
+    # terminate normally after every step, so only the end of the step with
+    # the vibrational analysis finishes the log.
+    NORMAL_TERMINATION = 'Normal termination'
+
+    # Marks the end of a failed job, after which nothing more is written.
+    ERROR_TERMINATION = 'Error termination'
+
+    def __init__(self, filename=None, width=Spectrum.LORENTZIAN_WIDTH, time=None, temp=None):
+        """
+        Constructor.
+        :param filename: the log the fed text comes from, attached to events.
+        :param width: lorentzian width to give parsed spectra.
+        :param time: time to give the parsed Configuration.
+        :param temp: temperature to give the parsed Configuration.
+        """
+
+        self.filename = filename
+        self.width = width
+        self.time = time
+        self.temp = temp
+        self.finished = False
+
+        self.matrix = None
+        self.raman_spectrum = None
+        self.ir_spectrum = None
+
+        self._partial_line = ''
+        self._matrix_lines = []
+        self._frequency_lines = []
+        self._frequencies_done = False
+
+    def feed(self, text):
+        """
+        Parse text appended to the log.
+        :param text: the newly appended text.
+        :returns: a list of LogEvents for each section completed by the text.
+        """
+
+        lines = (self._partial_line + text).split('\n')
+        self._partial_line = lines.pop()
+
+        events = []
+        for line in lines:
+            if self.finished:
+                break
+            events.extend(self._parse_line(line + '\n'))
+        return events
+
+    def close(self):
+        """
+        Flush a trailing line without a newline and mark the log finished.
+        A frequency section that was never completed, by the end of the
+        vibrational analysis or a termination line, is discarded: the log
+        may have been cut off part way through it.
+        :returns: a list of LogEvents for any sections completed by the flush.
+        """
+
+        events = []
+        if self._partial_line and not self.finished:
+            events.extend(self._parse_line(self._partial_line + '\n'))
+            self._partial_line = ''
+        self._frequency_lines = []
+        self.finished = True
+        return events
+
+    def _event(self, kind, value):
+        return LogEvent(self.filename, kind, value)
+
+    def _parse_line(self, line):
+
+        # Matrices are only followed until the frequency section starts
+        if not self._frequency_lines and not self._frequencies_done:
+            if self.MATRIX_START in line:
+                self._matrix_lines = []
+                return []
+            # Distance matrix is always terminated by a line containing
+            # 'stoich'
+            if 'stoich' in line.lower():
+                if self._matrix_lines:
+                    self.matrix = DistanceMatrix.from_log_lines(
+                        self._matrix_lines)
+                    self._matrix_lines = []
+                    return [self._event('matrix', self.matrix)]
+            elif DistanceMatrix.MATRIX_REGEX.match(line.strip()):
+                self._matrix_lines.append(line)
+                return []
+
+        if not self._frequencies_done:
+            if any(is_property_line(line, label) for label in self.FREQUENCY_LABELS):
+                self._frequency_lines.append(line)
+                return []
+            if self.FREQUENCY_SECTION_END in line:
+                return self._finish_frequencies()
+
+        if self.ERROR_TERMINATION in line:
+            events = self._finish_frequencies()
+            self.finished = True
+            return events
+
+        if self.NORMAL_TERMINATION in line:
+            events = self._finish_frequencies()
+            self.finished = self._frequencies_done
+            return events
+
+        return []
+
+    def _finish_frequencies(self):
+        """
+        Build the spectra (and Configuration, if the distance matrix has been
+        seen) from the collected frequency lines.
+        """
+
+        if self._frequencies_done or not self._frequency_lines:
+            return []
+        self._frequencies_done = True
+
+        events = []
+        for kind in ('raman', 'ir'):
+            try:
+                spectrum = Spectrum.from_log_lines(
+                    self._frequency_lines, kind, self.width)
+            except ValueError:
+                # e.g. a frequency job run without raman activities
+                continue
+            setattr(self, kind + '_spectrum', spectrum)
+            events.append(self._event(kind, spectrum))
+        self._frequency_lines = []
+
+        if self.matrix is not None and events:
+            configuration = Configuration(self.matrix, self.raman_spectrum,
+                                          self.ir_spectrum, self.time, self.temp)
+            events.append(self._event('configuration', configuration))
+
+        return events
+
+
+async def tail_log(filename, interval=1.0, idle_timeout=None,
+                   chunk_size=65536, width=Spectrum.LORENTZIAN_WIDTH):
+    """
+    Follow a Gaussian .log file as it is written, yielding LogEvents as
+    each section completes. Only newly appended bytes are read and parsed.
+    Stops when the job terminates after its vibrational analysis or with
+    an error, or when the log has not grown for idle_timeout seconds, in
+    which case a frequency section still being written is not yielded.
+    :param filename: path to the .log file. It need not exist yet.
+    :param interval: seconds to wait between polls for new data.
+    :param idle_timeout: seconds without new data before giving up, or None
+    to wait for job termination indefinitely.
+    :param chunk_size: maximum number of bytes to read at once.
+    :param width: lorentzian width to give parsed spectra.
+    """
+
+    loop = asyncio.get_running_loop()
+    idle = 0.0
+
+    while not os.path.exists(filename):
+        if idle_timeout is not None and idle >= idle_timeout:
+            return
+        await asyncio.sleep(interval)
+        idle += interval
+
+    parser = LogParser(filename, width)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    with open(filename, 'rb') as log_file:
+        while not parser.finished:
+            data = await loop.run_in_executor(None, log_file.read, chunk_size)
+
+            if data:
+                idle = 0.0
+                for event in parser.feed(decoder.decode(data)):
+                    yield event
+                continue
+
+            if os.path.getsize(filename) < log_file.tell():
+                # The log was truncated and rewritten; start again.
+                log_file.seek(0)
+                parser = LogParser(filename, width)
+                decoder.reset()
+                continue
+
+            if idle_timeout is not None and idle >= idle_timeout:
+                break
+            await asyncio.sleep(interval)
+            idle += interval
+
+    for event in parser.close():
+        yield event
+
+
+async def watch_logs(filenames, interval=1.0, idle_timeout=None,
+                     width=Spectrum.LORENTZIAN_WIDTH):
+    """
+    Follow many Gaussian .log files concurrently, yielding LogEvents from
+    all of them in the order their sections complete. A log that cannot be
+    read or parsed gives an 'error' LogEvent holding the exception, and the
+    other logs are still followed.
+    :param filenames: an iterable of paths to .log files.
+    :param interval: seconds to wait between polls for new data.
+    :param idle_timeout: seconds without new data before giving up on a log.
+    :param width: lorentzian width to give parsed spectra.
+    """
+
+    queue = asyncio.Queue()
+    finished = object()
+
+    async def follow(filename):
+        try:
+            async for event in tail_log(filename, interval, idle_timeout, width=width):
+                await queue.put(event)
+        except Exception as error:
+            await queue.put(LogEvent(filename, 'error', error))
+        finally:
+            await queue.put(finished)
+
+    tasks = [asyncio.ensure_future(follow(filename)) for filename in filenames]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is finished:
+                remaining -= 1
+            else:
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,253 @@
+"""
+Defines Trajectory class for representation of a time-ordered
+series of molecular Configurations.
+
+Part of gparse package.
+
+Copyright Sean McGrath 2015. Issued under the MIT License.
+"""
+
+import re
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .matrix import DistanceMatrix
+from .spectrum import spectrum_attribute
+from .util import is_numeric
+
+
+# Femtoseconds per unit of time, for comparing times given in different
+# units. Whole numbers, so equal times in different units stay equal.
+TIME_UNITS = {'fs': 1, 'ps': 1e3, 'ns': 1e6, 'us': 1e9, 'ms': 1e12, 's': 1e15}
+
+# A number, optionally followed by a unit, e.g. '10', '2.5 ps' or '100fs'.
+TIME_REGEX = re.compile(r'^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([^\d\s].*?)?\s*$')
+
+
+def _time_key(time):
+    """
+    Sort key for a Configuration time: a number, or a string holding a
+    number followed by an optional unit, e.g. '100 fs'.
+    :returns: (scale, value), where times can only be compared if their
+    scales match. Times in the units of TIME_UNITS are converted to
+    femtoseconds with scale 'fs'; other units are compared as given with the
+    unit as the scale, and plain numbers have scale ''.
+    """
+
+    if time is None:
+        raise ValueError('Configurations in a Trajectory must have a time.')
+    if is_numeric(time):
+        return '', float(time)
+
+    match = TIME_REGEX.match(time) if isinstance(time, str) else None
+    if match is None:
+        raise ValueError('Cannot read a time from {!r}; give a key to order '
+                         'the Trajectory by.'.format(time))
+    value, unit = float(match.group(1)), match.group(2) or ''
+    if unit in TIME_UNITS:
+        return 'fs', value * TIME_UNITS[unit]
+    return unit, value
+
+
+class Trajectory:
+    """
+    A series of Configurations kept in order of time.
+
+    Distances and spectra of every frame are stacked into flat arrays,
+    built on first use, so that one quantity can be extracted across all
+    frames with a single strided slice.
+    """
+
+    def __init__(self, configurations=(), key=None):
+        """
+        Constructor.
+        :param configurations: an iterable of Configurations, in any order.
+        Each must have a time.
+        :param key: an optional function giving a sort key for a time. By
+        default times are ordered by the number they hold, in the same
+        units or in units of TIME_UNITS, e.g. '9 fs' < '10 fs' < '1 ps'.
+        """
+
+        self.key = key
+        self._scale = None
+        frames = sorted(((self._time_key(c.time), i, c) for i, c in enumerate(configurations)),
+                        key=lambda frame: frame[:2])
+        self._keys = [frame[0] for frame in frames]
+        self.configurations = [frame[2] for frame in frames]
+        self._clear_storage()
+
+    def _time_key(self, time, record=True):
+        """
+        Get the sort key of a time, checking that it can be compared with
+        the times already in the Trajectory.
+        :param record: whether the time is being added, fixing the scale
+        of an empty Trajectory.
+        """
+
+        if self.key is not None:
+            if time is None:
+                raise ValueError('Configurations in a Trajectory must have a time.')
+            return self.key(time)
+
+        scale, value = _time_key(time)
+        if self._scale is None:
+            if record:
+                self._scale = scale
+        elif scale != self._scale:
+            raise ValueError('Cannot compare time {!r} with times {}.'.format(
+                time, 'in ' + self._scale if self._scale else 'without units'))
+        return value
+
+    def __len__(self):
+        return len(self.configurations)
+
+    def __iter__(self):
+        return iter(self.configurations)
+
+    def __getitem__(self, key):
+        """
+        Index to get a Configuration, or slice to get a new Trajectory.
+        """
+
+        if isinstance(key, slice):
+            return Trajectory(self.configurations[key], self.key)
+        return self.configurations[key]
+
+    def __str__(self):
+        if not self.configurations:
+            return 'Empty Trajectory'
+        return 'Trajectory of {} configurations from {} to {}'.format(
+            len(self), self.configurations[0].time, self.configurations[-1].time)
+
+    @property
+    def times(self):
+        """
+        The times of every frame, in order.
+        """
+
+        return [configuration.time for configuration in self.configurations]
+
+    def add(self, configuration):
+        """
+        Insert a Configuration in time order.
+        """
+
+        key = self._time_key(configuration.time)
+        index = bisect_right(self._keys, key)
+        self._keys.insert(index, key)
+        self.configurations.insert(index, configuration)
+        self._clear_storage()
+
+    def between(self, start=None, end=None):
+        """
+        Create a Trajectory of the frames with start <= time <= end.
+        :param start: earliest time to include, or None for no lower bound.
+        :param end: latest time to include, or None for no upper bound.
+        """
+
+        low = 0 if start is None else bisect_left(self._keys, self._time_key(start, False))
+        high = len(self) if end is None else bisect_right(self._keys, self._time_key(end, False))
+        return Trajectory(self.configurations[low:high], self.key)
+
+    def _clear_storage(self):
+        self._distances = None
+        self._distance_layout = None
+        self._spectra = {}
+
+    def _stacked_distances(self):
+        """
+        Build (once) the flattened distance matrices of every frame,
+        concatenated into one array.
+        """
+
+        if self._distances is None:
+            atoms, stride, _, self._distances = DistanceMatrix.stack(
+                configuration.matrix for configuration in self.configurations)
+            self._distance_layout = (atoms, stride)
+        return self._distances
+
+    def _pair_offset(self, pair):
+        atoms, stride = self._distance_layout
+        i, j = pair
+        if not (0 <= i < atoms and 0 <= j < atoms):
+            raise IndexError('Atom index out of range: {}'.format(pair))
+        if stride == atoms * atoms:
+            return i * atoms + j
+        # Lower triangular storage: row i holds columns 0 to i.
+        i, j = max(i, j), min(i, j)
+        return i * (i + 1) // 2 + j
+
+    def distances(self, pairs):
+        """
+        Extract the distance between atom pairs across every frame.
+        :param pairs: an iterable of (i, j) atom indices, as used to
+        index a DistanceMatrix.
+        :returns: a list with a time series (list of distances) per pair.
+        """
+
+        distances = self._stacked_distances()
+        if not self.configurations:
+            return [[] for _ in pairs]
+        stride = self._distance_layout[1]
+        return [distances[self._pair_offset(pair)::stride].tolist() for pair in pairs]
+
+    def distance(self, i, j):
+        """
+        Extract the distance between atoms i and j across every frame.
+        """
+
+        return self.distances([(i, j)])[0]
+
+    def _stacked_spectra(self, type):
+        """
+        Build (once) the frequencies and intensities of one type of spectrum
+        of every frame, concatenated into two arrays.
+        """
+
+        attribute = spectrum_attribute(type)
+
+        if attribute not in self._spectra:
+            frequencies, intensities = array('d'), array('d')
+            modes = None
+            for configuration in self.configurations:
+                spectrum = getattr(configuration, attribute)
+                if spectrum is None:
+                    raise ValueError('Every Configuration must have a {}.'.format(attribute))
+                if modes is None:
+                    modes = len(spectrum)
+                elif len(spectrum) != modes:
+                    raise ValueError('Every spectrum must have the same number of modes.')
+                frequencies.extend(spectrum.frequencies)
+                intensities.extend(spectrum.intensities)
+            self._spectra[attribute] = (frequencies, intensities, modes)
+        return self._spectra[attribute]
+
+    def intensities(self, modes, type='raman'):
+        """
+        Extract the intensities of normal modes across every frame.
+        :param modes: an iterable of mode indices into each spectrum.
+        :param type: 'raman' or 'ir'.
+        :returns: a list with a time series (list of intensities) per mode.
+        """
+
+        _, intensities, stride = self._stacked_spectra(type)
+        return [intensities[mode::stride].tolist() for mode in self._check_modes(modes, stride)]
+
+    def frequencies(self, modes, type='raman'):
+        """
+        Extract the frequencies of normal modes across every frame.
+        :param modes: an iterable of mode indices into each spectrum.
+        :param type: 'raman' or 'ir'.
+        :returns: a list with a time series (list of frequencies) per mode.
+        """
+
+        frequencies, _, stride = self._stacked_spectra(type)
+        return [frequencies[mode::stride].tolist() for mode in self._check_modes(modes, stride)]
+
+    @staticmethod
+    def _check_modes(modes, stride):
+        modes = list(modes)
+        for mode in modes:
+            if stride is not None and not 0 <= mode < stride:
+                raise IndexError('Mode index out of range: {}'.format(mode))
+        return modes
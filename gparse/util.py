@@ -6,6 +6,8 @@ Part of package raman.
 Copyright Sean McGrath 2015. Issued under the MIT License.
 """
 
+from math import sqrt
+
 
 def is_numeric(string):
     """
@@ -19,6 +21,61 @@ def is_numeric(string):
         return False
 
 
+def decode_floats(tokens, line_number=None, first_column=1):
+    """
+    Convert a sequence of numeric strings to a list of floats, converting
+    each token once.
+    :param tokens: the strings to convert.
+    :param line_number: line the tokens came from, for error messages.
+    :param first_column: column number of the first token, for error messages.
+    :raises ValueError: naming the first token that is not a number.
+    """
+    try:
+        return list(map(float, tokens))
+    except ValueError:
+        pass
+
+    # Only reached for malformed input: find the culprit to report it.
+    for column, token in enumerate(tokens, first_column):
+        if not is_numeric(token):
+            location = 'column {}'.format(column)
+            if line_number is not None:
+                location = 'line {}, {}'.format(line_number, location)
+            raise ValueError('Expected a number at {}, found {!r}.'.format(location, token))
+    raise ValueError('Could not convert {!r} to numbers.'.format(tokens))
+
+
+def decode_block(lines, separator=None, label=None, skip=0, columns=None, first_line=1):
+    """
+    Convert a block of lines of numbers into a list of rows of floats,
+    one row per non-blank line.
+    :param lines: an iterable of strings.
+    :param separator: the string separating values, or None for whitespace.
+    A trailing separator at the end of a line is ignored.
+    :param label: if given, only the text after the last occurrence of label
+    in each line is decoded, e.g. '--' for ' Frequencies --  1.0  2.0'.
+    :param skip: number of leading values on each line to ignore.
+    :param columns: the number of values every row must have, or None.
+    :param first_line: line number of the first line, for error messages.
+    :raises ValueError: naming the line and column of malformed values.
+    """
+    rows = []
+    for line_number, line in enumerate(lines, first_line):
+        if label is not None:
+            line = line.rpartition(label)[2]
+        tokens = line.strip().split(separator)
+        if separator is not None and tokens[-1] == '':
+            tokens.pop()
+        if not tokens:
+            continue
+        row = decode_floats(tokens[skip:], line_number, skip + 1)
+        if columns is not None and len(row) != columns:
+            raise ValueError('Expected {} values on line {}, found {}.'.format(
+                columns, line_number, len(row)))
+        rows.append(row)
+    return rows
+
+
 def flatten(array):
     """
     Return a flattened copy of a list of lists.
@@ -43,6 +100,66 @@ def linspace(start, end, number_of_points):
     return [start + interval * i for i in range(number_of_points)]
 
 
+def adaptive_space(function, start, end, seeds=(), tolerance=1e-3, max_depth=30):
+    """
+    Generate an ascending list of points from start to end, dense where
+    function curves sharply and sparse where it is nearly linear.
+    Intervals are bisected until linear interpolation between neighbouring
+    points is within tolerance of function at the interval midpoint.
+    :param function: a callable function that returns numbers.
+    :param start: starting point of list.
+    :param end: ending point of list.
+    :param seeds: points to include in the initial grid, e.g. the locations
+    of peaks, so that narrow features are not stepped over.
+    :param tolerance: largest allowed absolute interpolation error.
+    :param max_depth: maximum number of times an initial interval is bisected.
+    """
+    if start >= end:
+        raise ValueError(
+            'The starting value must be less than the ending value.')
+
+    initial = sorted(set([start, end] + [x for x in seeds if start < x < end]))
+    values = [function(x) for x in initial]
+
+    points = [initial[0]]
+    for a, b, f_a, f_b in zip(initial, initial[1:], values, values[1:]):
+        # Depth-first bisection, so points are appended in ascending order
+        # over the right hand ends of the pending intervals.
+        stack = [(b, f_b, 0)]
+        left, f_left = a, f_a
+        while stack:
+            right, f_right, depth = stack[-1]
+            middle = (left + right) / 2
+            f_middle = function(middle)
+            if depth < max_depth and \
+                    abs(f_middle - (f_left + f_right) / 2) > tolerance:
+                stack[-1] = (right, f_right, depth + 1)
+                stack.append((middle, f_middle, depth + 1))
+            else:
+                stack.pop()
+                points.append(right)
+                left, f_left = right, f_right
+
+    return points
+
+
+def rms_deviation(values, other_values, distance_threshold=None):
+    """
+    Calculate the root mean square deviation between two equal length
+    sequences of values, e.g. flattened distance matrices.
+    :param distance_threshold: a difference under which a pair of values
+    must fall in order to be factored into the RMS.
+    """
+
+    pairs = zip(values, other_values)
+    if distance_threshold:
+        squared_differences = [(a - b)**2 for a, b in pairs if abs(a - b) < distance_threshold]
+    else:
+        squared_differences = [(a - b)**2 for a, b in pairs]
+
+    return sqrt(sum(squared_differences) / len(squared_differences))
+
+
 def integrate(x_array, y_array):
     """
     Calculate the numeric integral of a 2D data set via the midpoint rule.
@@ -54,7 +171,7 @@ def integrate(x_array, y_array):
 
     i = 0
     integral = 0
-    while i < len(x_array) - 2:
+    while i < len(x_array) - 1:
         average = (y_array[i] + y_array[i + 1]) / 2
         interval = x_array[i + 1] - x_array[i]
         integral += average * interval
@@ -71,10 +188,31 @@ def integrate_function(function, x_array):
     """
 
     i = integral = 0
-    while i < len(x_array) - 2:
+    while i < len(x_array) - 1:
         average = (function(x_array[i]) + function(x_array[i + 1])) / 2
         interval = x_array[i + 1] - x_array[i]
         integral += average * interval
         i += 1
 
     return integral
+
+
+def integrate_gauss(function, x_array):
+    """
+    Calculate the numeric integral of a function by the three point
+    Gauss-Legendre rule on each interval of an x array. Far more accurate
+    than the midpoint rule over the long intervals of adaptive x arrays.
+    :param function: a callable function that returns numbers.
+    :param x_array: a list of ascending numbers along which to integrate.
+    """
+
+    offset = sqrt(3 / 5)
+    integral = 0
+    for left, right in zip(x_array, x_array[1:]):
+        middle = (left + right) / 2
+        half = (right - left) / 2
+        integral += half * (5 * function(middle - half * offset)
+                            + 8 * function(middle)
+                            + 5 * function(middle + half * offset)) / 9
+
+    return integral
@@ -8,4 +8,7 @@ setup(name='gparse',
       author_email='srmcgrat@umass.edu',
       license='MIT',
       packages=['gparse'],
+      entry_points={
+          'console_scripts': ['gparse = gparse.cli:main'],
+      },
       zip_safe=False)
@@ -8,7 +8,24 @@ Issued under the MIT licenese.
 
 import unittest
 import raman
+import raman.tail
+import raman.cli
+import raman.fitting
+import raman.modes
+import raman.logfile
+import raman.fchk
+import raman.ensemble
+import raman.clustering
+import raman.plotting
+import asyncio
 import copy
+import gzip
+import lzma
+import math
+import os
+import subprocess
+import sys
+import tempfile
 
 def triangular_number(n):
     """
@@ -35,6 +52,23 @@ class TestUtilities(unittest.TestCase):
         self.assertRaises(ValueError, raman.util.linspace, 10, 0, 100)
         self.assertRaises(ValueError, raman.util.linspace, 0, 10, 1)
 
+    def test_adaptive_space(self):
+        points = raman.util.adaptive_space(lambda x: x**2, -1, 1, tolerance=1e-2)
+        self.assertEqual(points, sorted(points))
+        self.assertEqual((points[0], points[-1]), (-1, 1))
+        self.assertEqual(len(raman.util.adaptive_space(lambda x: x, 0, 1)), 2)
+
+    def test_decode_block(self):
+        lines = [' Frequencies --   1.5   2.5', ' Frequencies ---  3.5']
+        self.assertEqual(raman.util.decode_block(lines, label='--'), [[1.5, 2.5], [3.5]])
+        self.assertEqual(raman.util.decode_block(['1,', '', '2,3,'], separator=','),
+                         [[1.0], [2.0, 3.0]])
+        self.assertEqual(raman.util.decode_block(['  1   8  0.1  0.2'], skip=2), [[0.1, 0.2]])
+
+        with self.assertRaisesRegex(ValueError, 'line 2, column 2'):
+            raman.util.decode_block(['1 2', '3 x'])
+        self.assertRaises(ValueError, raman.util.decode_block, ['1 2', '3'], columns=2)
+
     def test_flatten(self):
         test_list = [['a'], ['b'], ['c']]
         self.assertEqual(raman.util.flatten(test_list), ['a', 'b', 'c'])
@@ -55,6 +89,47 @@ class TestSpectrum(unittest.TestCase):
             len(self.spectrum.as_list()),
             len(self.spectrum.x_array()))
 
+    def test_x_array_range(self):
+        x_array = self.spectrum.x_array(10, 20, 11)
+        self.assertEqual(x_array[0], 10)
+        self.assertEqual(x_array[-1], 20)
+        self.assertEqual(len(self.spectrum.as_list(11, 10, 20)), 11)
+
+    def test_adaptive_x_array(self):
+        spectrum = raman.Spectrum([1000, 3000], [10, 20])
+        x_array = spectrum.x_array(0, 4000, adaptive=True)
+
+        self.assertEqual(x_array, sorted(x_array))
+        self.assertEqual((x_array[0], x_array[-1]), (0, 4000))
+        self.assertIn(1000, x_array)
+        self.assertIn(3000, x_array)
+        self.assertTrue(len(x_array) < raman.Spectrum.NUMBER_OF_POINTS / 10)
+
+        # Integral of each lorentzian over the whole line is pi * width * amplitude
+        exact = 30 * 3.14159265 * spectrum.lorentzian_width
+        adaptive = spectrum.integral_over(-1e5, 1e5, adaptive=True, tolerance=1e-5)
+        self.assertAlmostEqual(adaptive / exact, 1, places=2)
+
+    def test_spectrum_type(self):
+        self.assertEqual(raman.spectrum.spectrum_type('r'), 'raman')
+        self.assertEqual(raman.spectrum.spectrum_attribute('infrared'), 'ir_spectrum')
+        self.assertRaises(ValueError, raman.spectrum.spectrum_attribute, 'uv')
+
+    def test_integral_to_peak(self):
+        spectrum = raman.Spectrum([1000, 3000], [10, 20])
+
+        def exact(x_min, x_max):
+            width = spectrum.lorentzian_width
+            return sum(intensity * width * (math.atan((x_max - frequency) / width)
+                                            - math.atan((x_min - frequency) / width))
+                       for frequency, intensity in zip(spectrum.frequencies, spectrum.intensities))
+
+        # Ranges ending on a peak top, and spanning long empty stretches
+        for x_min, x_max in ((990, 1000), (2990, 3000), (0, 4000), (1000, 3000)):
+            for adaptive in (False, True):
+                integral = spectrum.integral_over(x_min, x_max, adaptive=adaptive)
+                self.assertAlmostEqual(integral / exact(x_min, x_max), 1, places=4)
+
     def test_from_csv(self):
 
         self.assertRaises(ValueError, raman.Spectrum.from_csv, 'ramantest.py')
@@ -120,6 +195,9 @@ class TestDistanceMatrix(unittest.TestCase):
             test_matrix2 = raman.DistanceMatrix.from_csv(csv_file)
             self.assertEqual(self.test_matrix, test_matrix2)
 
+        self.assertRaises(ValueError, raman.DistanceMatrix.from_csv,
+                          ['0.0,', '1.0,x,'])
+
     def test_from_log_file(self):
         test_matrix = raman.DistanceMatrix.from_log_file('test_log.log')
         self.assertTrue(all([row[-1] == 0 for row in test_matrix]))
@@ -127,6 +205,16 @@ class TestDistanceMatrix(unittest.TestCase):
             all([all([item != 0 for item in row[:-1]]) for row in test_matrix]))
         self.assertEqual(test_matrix, self.test_matrix)
 
+    def test_from_log_lines(self):
+        with open('test_water.log') as log_file:
+            lines = log_file.readlines()
+        matrix = raman.DistanceMatrix.from_log_lines(lines)
+        self.assertEqual([len(row) for row in matrix], [1, 2, 3])
+
+        # A malformed row is an error, not a missing row
+        bad_lines = [line.replace('0.968812   0.000000', '0.96x812   0.000000') for line in lines]
+        self.assertRaisesRegex(ValueError, 'row 2', raman.DistanceMatrix.from_log_lines, bad_lines)
+
     def test_flattened(self):
         flat_matrix = self.test_matrix.flattened
 
@@ -157,6 +245,673 @@ class TestDistanceMatrix(unittest.TestCase):
         self.assertTrue(self.test_matrix.rms_deviation(added_matrix) != \
             self.test_matrix.rms_deviation(added_matrix, 5))
 
+    def test_stack(self):
+        atoms, stride, units, values = raman.DistanceMatrix.stack(
+            [self.test_matrix, self.test_matrix >> 1])
+        self.assertEqual((atoms, units), (len(self.test_matrix), self.test_matrix.units))
+        self.assertEqual(values[:stride].tolist(), self.test_matrix.flattened)
+        self.assertEqual(values[stride:].tolist(), (self.test_matrix >> 1).flattened)
+
+        smaller = raman.DistanceMatrix([[0], [1, 0]])
+        self.assertRaises(ValueError, raman.DistanceMatrix.stack, [self.test_matrix, smaller])
+        self.assertRaises(ValueError, raman.DistanceMatrix.stack,
+                          [smaller, raman.DistanceMatrix([[0], [1, 0]], 'nm')])
+
+
+class TestLogParser(unittest.TestCase):
+    """
+    Tests for incremental parsing of logs that are still being written.
+    """
+
+    def setUp(self):
+        with open('test_water.log') as log_file:
+            self.text = log_file.read()
+
+    def test_chunked_feed(self):
+        parser = raman.tail.LogParser('test_water.log')
+        events = []
+        for i in range(0, len(self.text), 7):
+            events.extend(parser.feed(self.text[i:i + 7]))
+
+        self.assertTrue(parser.finished)
+        self.assertEqual([event.kind for event in events],
+                         ['matrix', 'raman', 'ir', 'configuration'])
+        self.assertEqual(parser.raman_spectrum,
+                         raman.Spectrum.from_log_file('test_water.log'))
+        self.assertEqual(parser.matrix,
+                         raman.DistanceMatrix.from_log_file('test_water.log'))
+
+    def test_compound_job(self):
+        # An opt freq job terminates normally after the optimisation step too
+        optimisation = self.text[:self.text.index(' and normal coordinates:')]
+        optimisation = optimisation.replace('Harmonic frequencies', 'Optimization completed')
+        # The optimisation starts from a different geometry
+        optimisation = optimisation.replace('0.968812', '0.971234')
+        text = optimisation + ' Normal termination of Gaussian 09.\n' + self.text
+
+        parser = raman.tail.LogParser()
+        events = parser.feed(text)
+        self.assertTrue(parser.finished)
+        self.assertEqual([event.kind for event in events],
+                         ['matrix', 'matrix', 'raman', 'ir', 'configuration'])
+
+        # The vibrational analysis is of the last geometry
+        matrix = raman.DistanceMatrix.from_log_file('test_water.log')
+        self.assertNotEqual(events[0].value, matrix)
+        self.assertEqual(events[1].value, matrix)
+        self.assertEqual(events[-1].value.matrix, matrix)
+
+        parser = raman.tail.LogParser()
+        events = parser.feed(optimisation + ' Error termination via Lnk1e.\n' + self.text)
+        self.assertTrue(parser.finished)
+        self.assertEqual([event.kind for event in events], ['matrix'])
+
+    def test_watch_logs(self):
+        async def watch(filenames):
+            return [event async for event in raman.tail.watch_logs(
+                filenames, interval=0.01, idle_timeout=0.05)]
+
+        # A log that cannot be read does not stop the others being followed
+        with tempfile.TemporaryDirectory() as directory:
+            events = asyncio.run(watch([directory, 'test_water.log']))
+        errors = [event for event in events if event.kind == 'error']
+        self.assertEqual([event.filename for event in errors], [directory])
+        self.assertIsInstance(errors[0].value, OSError)
+        self.assertEqual([event.kind for event in events if event.filename == 'test_water.log'],
+                         ['matrix', 'raman', 'ir', 'configuration'])
+
+    def test_incomplete_section(self):
+        parser = raman.tail.LogParser()
+        events = parser.feed(self.text[:self.text.index('Raman Activ')])
+        self.assertEqual([event.kind for event in events], ['matrix'])
+        self.assertFalse(parser.finished)
+
+        # Closing a log cut off before the end of its vibrational analysis
+        # does not present the partial section as complete
+        parser = raman.tail.LogParser()
+        events = parser.feed(self.text[:self.text.index(' - Thermochemistry')])
+        events.extend(parser.close())
+        self.assertEqual([event.kind for event in events], ['matrix'])
+        self.assertTrue(parser.finished)
+        self.assertEqual((parser.raman_spectrum, parser.ir_spectrum), (None, None))
+
+    def test_truncated_peaks(self):
+        with open('test_water.log') as log_file:
+            lines = log_file.readlines()
+        assigner = raman.PeakAssigner('test_water.log')
+        self.assertEqual(len(assigner.peaks), 3)
+        assigner.lines = lines[:-8]
+        assigner.peaks, assigner.done = [], False
+        assigner.index = lines.index(' and normal coordinates:\n') + 1
+        assigner.first_line = 1
+        assigner.make_peaks()
+        self.assertEqual(assigner.peaks, [])
+        self.assertTrue(assigner.done)
+
+    def test_whitespace_blank_lines(self):
+        # Gaussian usually writes blank lines as a single space
+        with open('test_water.log') as log_file:
+            lines = [' \n' if line == '\n' else line for line in log_file]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'spaced.log')
+            with open(path, 'w') as log_file:
+                log_file.writelines(lines)
+            assigner = raman.PeakAssigner(path)
+        self.assertEqual(len(assigner.peaks), 3)
+        self.assertEqual([len(peak.atoms) for peak in assigner.peaks], [3, 3, 3])
+
+        # A malformed line before the end of the log is not mistaken for truncation
+        end = next(i for i, line in enumerate(lines) if line.startswith('     3   1 '))
+        assigner.lines = lines[:end] + ['     3   1     0.00\n'] + lines[end + 1:]
+        assigner.peaks, assigner.done = [], False
+        assigner.index = lines.index(' and normal coordinates:\n') + 1
+        assigner.first_line = 1
+        self.assertRaisesRegex(ValueError, 'line {}'.format(end + 1), assigner.make_peaks)
+
+    def test_assigner_from_log_lines(self):
+        expected = raman.PeakAssigner('test_water.log')
+        assigner = raman.PeakAssigner.from_log_lines(self.text.splitlines(True))
+        self.assertEqual([peak.frequency for peak in assigner.peaks],
+                         [peak.frequency for peak in expected.peaks])
+        for peak, expected_peak in zip(assigner.peaks, expected.peaks):
+            self.assertEqual([(atom.number, atom.x, atom.y, atom.z) for atom in peak.atoms],
+                             [(atom.number, atom.x, atom.y, atom.z) for atom in expected_peak.atoms])
+        self.assertEqual(raman.PeakAssigner.from_log_lines(['No frequencies\n']).peaks, [])
+
+    def test_line_numbers(self):
+        # Strict parsing errors give the line of the whole file
+        lines = self.text.splitlines(True)
+        for line_number, bad_line in ((33, ' Raman Activ --      6.6123               1O5.3402\n'),
+                                      (38, '     2   1     0.00   0.43  -0.56     0.00   0.58   0.4O\n')):
+            bad_lines = list(lines)
+            bad_lines[line_number - 1] = bad_line
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bad.log')
+                with open(path, 'w') as log_file:
+                    log_file.writelines(bad_lines)
+                message = 'line {},'.format(line_number)
+                self.assertRaisesRegex(ValueError, message, raman.PeakAssigner, path)
+                if line_number == 33:
+                    self.assertRaisesRegex(ValueError, message, raman.Spectrum.from_log_file, path)
+
+    def test_title_mentions_labels(self):
+        # Only property lines are parsed, not other lines naming a property
+        text = self.text.replace('Water frequency calculation',
+                                 'Water Frequencies calculation: Raman Activ and IR Inten')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'titled.log')
+            with open(path, 'w') as log_file:
+                log_file.write(text)
+            spectrum = raman.Spectrum.from_log_file('test_water.log')
+            self.assertEqual(raman.Spectrum.from_log_file(path), spectrum)
+            self.assertEqual(raman.Spectrum.from_log_file(path, type='ir'),
+                             raman.Spectrum.from_log_file('test_water.log', type='ir'))
+            self.assertEqual(len(raman.PeakAssigner(path).peaks), 3)
+
+        parser = raman.tail.LogParser()
+        events = parser.feed(text)
+        self.assertEqual([event.kind for event in events],
+                         ['matrix', 'raman', 'ir', 'configuration'])
+        self.assertEqual(parser.raman_spectrum, spectrum)
+
+
+class TestCommandLine(unittest.TestCase):
+    """
+    Tests for the gparse command line entry point.
+    """
+
+    def test_extract(self):
+        record = raman.cli.extract('test_water.log')
+        self.assertNotIn('error', record)
+        self.assertEqual(record['raman']['frequencies'],
+                         raman.Spectrum.from_log_file('test_water.log').frequencies)
+        self.assertEqual(len(record['matrix']), 3)
+        self.assertEqual(len(record['assignments']), 3)
+
+        self.assertIn('error', raman.cli.extract('test_matrix.csv'))
+
+    def test_missing_kind(self):
+        # A frequency job run without raman still gives its other data
+        with open('test_water.log') as log_file:
+            lines = [line for line in log_file if 'Raman Activ' not in line]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'ir_only.log')
+            with open(path, 'w') as log_file:
+                log_file.writelines(lines)
+            record = raman.cli.extract(path)
+            self.assertEqual(raman.cli.main([path, '-o', os.path.join(directory, 'out.csv'),
+                                             '-f', 'csv']), 0)
+
+        self.assertNotIn('error', record)
+        self.assertEqual(list(record['errors']), ['raman'])
+        self.assertEqual(len(record['ir']['frequencies']), 3)
+        self.assertEqual(len(record['matrix']), 3)
+        self.assertEqual(len(record['assignments']), 3)
+        rows = list(raman.cli.csv_rows(record))
+        self.assertEqual(rows[0][:3], (path, 'error', 'raman'))
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'out.jsonl')
+            args = ['test_water.log', '-e', 'raman', '-o', output, '--resume']
+
+            self.assertEqual(raman.cli.main(args), 0)
+            self.assertEqual(raman.cli.main(args), 0)
+
+            with open(output) as output_file:
+                self.assertEqual(len(output_file.readlines()), 1)
+            self.assertEqual(raman.cli.read_journal(output + '.done'),
+                             {'test_water.log'})
+
+    def test_resume_failures(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'out.jsonl')
+            args = ['test_matrix.csv', '-o', output, '--resume']
+
+            self.assertEqual(raman.cli.main(args), 1)
+            self.assertEqual(raman.cli.main(args), 0)
+
+            with open(output) as output_file:
+                self.assertEqual(len(output_file.readlines()), 1)
+
+
+class TestFitting(unittest.TestCase):
+    """
+    Tests for fitting spectra to target data.
+    """
+
+    def setUp(self):
+        self.spectrum = raman.Spectrum([1000, 1600, 3000], [10, 40, 20])
+        target = raman.Spectrum([f * 0.96 for f in self.spectrum.frequencies],
+                                [i * 2.5 for i in self.spectrum.intensities], 8)
+        x_array = target.x_array(500, 3500, 500)
+        self.target = (x_array, [target.fit_function(x) for x in x_array])
+
+    def test_fit(self):
+        result = raman.fitting.fit_spectra(self.spectrum, self.target, width=5)
+        self.assertTrue(result.converged)
+        self.assertAlmostEqual(result.width, 8)
+        self.assertAlmostEqual(result.frequency_scale, 0.96)
+        self.assertAlmostEqual(result.intensity_scale, 2.5)
+        self.assertAlmostEqual(result.rms_residual, 0)
+
+        fitted = result.apply(self.spectrum)
+        self.assertAlmostEqual(fitted.frequencies[0], 960)
+
+    def test_fixed_parameters(self):
+        result = raman.fitting.fit_spectra(
+            self.spectrum, self.target, width=5, fit_width=False)
+        self.assertEqual(result.width, 5)
+        self.assertTrue(result.rms_residual > 0)
+
+    def test_ensemble_average(self):
+        # Together the spectra are fitted by their average, which matches
+        # the target although neither spectrum alone does
+        low = raman.Spectrum(self.spectrum.frequencies, [5, 70, 0])
+        high = raman.Spectrum(self.spectrum.frequencies, [15, 10, 40])
+        result = raman.fitting.fit_spectra([low, high], self.target, width=5)
+        self.assertTrue(result.converged)
+        self.assertAlmostEqual(result.width, 8)
+        self.assertAlmostEqual(result.frequency_scale, 0.96)
+        self.assertAlmostEqual(result.intensity_scale, 2.5)
+        self.assertAlmostEqual(result.rms_residual, 0)
+
+        for result in raman.fitting.fit_spectra([low, high], self.target, width=5, per_spectrum=True):
+            self.assertTrue(result.rms_residual > 1)
+
+    def test_per_spectrum(self):
+        results = raman.fitting.fit_spectra(
+            [self.spectrum, self.spectrum.copy()], self.target, per_spectrum=True)
+        self.assertEqual(len(results), 2)
+        for result in results:
+            self.assertAlmostEqual(result.frequency_scale, 0.96)
+
+
+class TestSpectrumCollection(unittest.TestCase):
+    """
+    Tests for the SpectrumCollection class.
+    """
+
+    def setUp(self):
+        self.spectra = [raman.Spectrum([100, 200 + i], [1, i + 1]) for i in range(5)]
+        configurations = [raman.Configuration(None, spectrum, temperature=300 + 10 * (i % 2))
+                          for i, spectrum in enumerate(self.spectra)]
+        self.collection = raman.SpectrumCollection.from_configurations(configurations)
+
+    def test_views(self):
+        self.assertEqual(len(self.collection), 5)
+        self.assertEqual(list(self.collection), self.spectra)
+        self.assertEqual(self.collection[-1], self.spectra[-1])
+        self.assertEqual(list(self.collection[1:3]), self.spectra[1:3])
+        self.assertRaises(IndexError, self.collection.__getitem__, 5)
+
+    def test_evaluate(self):
+        x_array = self.collection.x_array(points=50)
+        values = self.collection.evaluate(x_array, chunk_size=2)
+        self.assertEqual(len(values), 5)
+        for row, spectrum in zip(values, self.spectra):
+            self.assertEqual(row, [spectrum.fit_function(x) for x in x_array])
+
+        average = self.collection.average(x_array)
+        self.assertAlmostEqual(average[10], sum(row[10] for row in values) / 5)
+
+    def test_where(self):
+        selected = self.collection.where(temperature=310)
+        self.assertEqual(list(selected), self.spectra[1::2])
+        self.assertEqual(len(self.collection.select(lambda c: c.temperature > 400)), 0)
+
+
+class TestTrajectory(unittest.TestCase):
+    """
+    Tests for the Trajectory class.
+    """
+
+    def setUp(self):
+        self.matrix = raman.DistanceMatrix.from_csv('test_matrix.csv')
+        self.configurations = [
+            raman.Configuration(self.matrix >> time, raman.Spectrum([100, 200], [time, 1]),
+                                time=str(time))
+            for time in (3, 1, 2, 10)]
+        self.trajectory = raman.Trajectory(self.configurations)
+
+    def test_order(self):
+        self.assertEqual(self.trajectory.times, ['1', '2', '3', '10'])
+        self.trajectory.add(raman.Configuration(self.matrix, time=5))
+        self.assertEqual(self.trajectory.times, ['1', '2', '3', 5, '10'])
+
+    def test_time_units(self):
+        times = ['100 fs', '1 ps', '9 fs', '10fs', '0.5 ps']
+        trajectory = raman.Trajectory(raman.Configuration(self.matrix, time=time) for time in times)
+        self.assertEqual(trajectory.times, ['9 fs', '10fs', '100 fs', '0.5 ps', '1 ps'])
+        self.assertEqual(trajectory.between('10 fs', '500 fs').times, ['10fs', '100 fs', '0.5 ps'])
+
+        self.assertRaises(ValueError, trajectory.add, raman.Configuration(self.matrix, time=5))
+        self.assertRaises(ValueError, self.trajectory.add,
+                          raman.Configuration(self.matrix, time='5 fs'))
+        self.assertRaises(ValueError, raman.Trajectory,
+                          [raman.Configuration(self.matrix, time='start')])
+
+        trajectory = raman.Trajectory([raman.Configuration(self.matrix, time=time)
+                                       for time in ('b', 'c', 'a')], key=str)
+        self.assertEqual(trajectory.times, ['a', 'b', 'c'])
+
+    def test_slicing(self):
+        self.assertEqual(self.trajectory[0].time, '1')
+        self.assertEqual(self.trajectory[1:3].times, ['2', '3'])
+        self.assertEqual(self.trajectory.between(2, 3).times, ['2', '3'])
+        self.assertEqual(self.trajectory.between(start=3).times, ['3', '10'])
+
+    def test_distances(self):
+        series = self.trajectory.distances([(10, 5), (5, 10), (0, 0)])
+        expected = [self.matrix[10][5] + time for time in (1, 2, 3, 10)]
+        self.assertEqual(series[0], expected)
+        self.assertEqual(series[1], expected)
+        self.assertEqual(series[2], [1.0, 2.0, 3.0, 10.0])
+        self.assertRaises(IndexError, self.trajectory.distance, 0, len(self.matrix))
+
+    def test_intensities(self):
+        self.assertEqual(self.trajectory.intensities([0]), [[1, 2, 3, 10]])
+        self.assertEqual(self.trajectory.frequencies([1]), [[200] * 4])
+        self.assertRaises(ValueError, self.trajectory.intensities, [0], 'ir')
+
+
+class TestModeTracking(unittest.TestCase):
+    """
+    Tests for matching normal modes between configurations.
+    """
+
+    def setUp(self):
+        self.peaks = raman.PeakAssigner('test_water.log').peaks
+
+    def test_optimal_assignment(self):
+        cost = [[4, 1, 3], [2, 0, 5], [3, 2, 2]]
+        self.assertEqual(raman.modes.optimal_assignment(cost), [1, 0, 2])
+        self.assertEqual(raman.modes.optimal_assignment([[1], [0]]), [None, 0])
+
+    def test_overlap_matrix(self):
+        overlaps = raman.modes.overlap_matrix(self.peaks, self.peaks)
+        for k, row in enumerate(overlaps):
+            self.assertAlmostEqual(row[k], 1)
+            self.assertEqual(max(row), row[k])
+
+    def test_tracker(self):
+        shuffled = [self.peaks[2], self.peaks[0], self.peaks[1]]
+        tracker = raman.modes.ModeTracker([self.peaks, shuffled, self.peaks])
+        self.assertEqual(tracker.indices, [[0, 1, 2], [1, 2, 0], [0, 1, 2]])
+        self.assertEqual(tracker.frequencies(2), [self.peaks[2].frequency] * 3)
+
+
+class TestCompressedLogs(unittest.TestCase):
+    """
+    Tests for reading compressed logs and jumping to their sections.
+    """
+
+    def setUp(self):
+        with open('test_water.log', 'rb') as log_file:
+            self.data = log_file.read()
+        self.directory = tempfile.TemporaryDirectory()
+        self.gzip_log = os.path.join(self.directory.name, 'water.log.gz')
+        self.xz_log = os.path.join(self.directory.name, 'water.log.xz')
+        self.blocked_log = os.path.join(self.directory.name, 'water.bgz')
+
+        with open(self.gzip_log, 'wb') as log_file:
+            log_file.write(gzip.compress(self.data))
+        with open(self.xz_log, 'wb') as log_file:
+            log_file.write(lzma.compress(self.data))
+        with open(self.blocked_log, 'wb') as log_file:
+            for i in range(0, len(self.data), 256):
+                log_file.write(gzip.compress(self.data[i:i + 256]))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_compression(self):
+        self.assertEqual(raman.logfile.compression('test_water.log'), None)
+        self.assertEqual(raman.logfile.compression(self.gzip_log), 'gzip')
+        self.assertEqual(raman.logfile.compression(self.xz_log), 'xz')
+
+    def test_from_log_file(self):
+        spectrum = raman.Spectrum.from_log_file('test_water.log')
+        matrix = raman.DistanceMatrix.from_log_file('test_water.log')
+        for filename in (self.gzip_log, self.xz_log, self.blocked_log):
+            self.assertEqual(raman.Spectrum.from_log_file(filename), spectrum)
+            self.assertEqual(raman.DistanceMatrix.from_log_file(filename), matrix)
+            self.assertEqual(len(raman.PeakAssigner(filename).peaks), 3)
+            self.assertEqual(raman.Configuration.from_log_file(filename).matrix, matrix)
+
+    def test_section_index(self):
+        index = raman.logfile.SectionIndex.build(self.blocked_log)
+        self.assertTrue(len(index.members) > 1)
+        self.assertIn('frequencies', index)
+
+        member_offset, skip = index.locate('frequencies')
+        self.assertTrue(member_offset > 0)
+        self.assertTrue(skip < 256)
+
+        with raman.logfile.open_log(self.blocked_log, 'frequencies', index) as log_file:
+            self.assertIn('Harmonic frequencies', log_file.readline())
+
+        self.assertEqual(raman.Spectrum.from_log_file(self.blocked_log, index=index),
+                         raman.Spectrum.from_log_file('test_water.log'))
+        self.assertEqual(len(raman.PeakAssigner(self.blocked_log, index=index).peaks), 3)
+
+
+class TestFchk(unittest.TestCase):
+    """
+    Tests for reading Gaussian formatted checkpoint files.
+    """
+
+    def test_read_fchk(self):
+        values = raman.fchk.read_fchk('test_water.fchk')
+        self.assertEqual(values['Number of atoms'], 3)
+        self.assertEqual(values['Atomic numbers'], [8, 1, 1])
+        self.assertEqual(len(values['Alpha Orbital Energies']), 7)
+        self.assertAlmostEqual(values['Total Energy'], -76.4089533)
+
+        values = raman.fchk.read_fchk('test_water.fchk', ['Vib-E2'])
+        self.assertEqual(list(values), ['Vib-E2'])
+
+    def test_from_fchk(self):
+        for type in ('raman', 'ir'):
+            self.assertEqual(raman.Spectrum.from_fchk('test_water.fchk', type),
+                             raman.Spectrum.from_log_file('test_water.log', type))
+
+        matrix = raman.DistanceMatrix.from_fchk('test_water.fchk')
+        log_matrix = raman.DistanceMatrix.from_log_file('test_water.log')
+        self.assertTrue(matrix.rms_deviation(log_matrix) < 1e-3)
+
+        fchk_peaks = raman.PeakAssigner.from_fchk('test_water.fchk').peaks
+        log_peaks = raman.PeakAssigner('test_water.log').peaks
+        for fchk_peak, log_peak in zip(fchk_peaks, log_peaks):
+            self.assertEqual(fchk_peak.frequency, log_peak.frequency)
+            self.assertEqual(fchk_peak.displacements, log_peak.displacements)
+
+        values = raman.fchk.read_fchk('test_water.fchk', raman.fchk.SPECTRUM_LABELS)
+        self.assertEqual(raman.Spectrum.from_fchk_values(values, 'ir'),
+                         raman.Spectrum.from_fchk('test_water.fchk', 'ir'))
+
+        values = raman.fchk.read_fchk('test_water.fchk', raman.fchk.MODE_LABELS)
+        self.assertEqual([peak.displacements for peak in raman.PeakAssigner.from_fchk_values(values).peaks],
+                         [peak.displacements for peak in fchk_peaks])
+
+        assigner = raman.PeakAssigner.from_peaks(log_peaks[:2], heavy_only=True)
+        self.assertEqual(assigner.peaks, log_peaks[:2])
+        self.assertTrue(assigner.heavy_only)
+
+        configuration = raman.Configuration.from_fchk('test_water.fchk')
+        self.assertEqual(len(configuration), 3)
+        record = raman.cli.extract('test_water.fchk')
+        self.assertEqual(record['raman']['frequencies'], configuration.raman_spectrum.frequencies)
+        self.assertEqual([assignment['frequency'] for assignment in record['assignments']],
+                         [peak.frequency for peak in fchk_peaks])
+
+
+class TestEnsembleStore(unittest.TestCase):
+    """
+    Tests for sharing Configurations between processes with EnsembleStore.
+    """
+
+    def setUp(self):
+        self.matrix = raman.DistanceMatrix.from_csv('test_matrix.csv')
+        self.configurations = [
+            raman.Configuration(self.matrix >> shift, raman.Spectrum([100, 200], [shift, 1], 2))
+            for shift in range(5)]
+
+    def test_lazy_import(self):
+        # Importing the package does not load multiprocessing until needed
+        code = ('import sys, {0}; loaded = "multiprocessing" in sys.modules; '
+                '{0}.EnsembleStore; print(loaded, "multiprocessing" in sys.modules)')
+        package = os.path.dirname(os.path.dirname(os.path.abspath(raman.__file__)))
+        output = subprocess.check_output([sys.executable, '-c', code.format(raman.__name__)],
+                                         cwd=package)
+        self.assertEqual(output.split(), [b'False', b'True'])
+
+    def test_view(self):
+        with raman.EnsembleStore(self.configurations) as store:
+            with store.view() as view:
+                self.assertEqual(len(view), 5)
+                self.assertEqual(view.matrix(2), self.configurations[2].matrix)
+                self.assertEqual(view.spectrum(3), self.configurations[3].raman_spectrum)
+                self.assertEqual(view.spectrum(3).lorentzian_width, 2)
+                self.assertEqual(view.intensities(-1).tolist(), [4, 1])
+                self.assertEqual(view.rms_deviation(1, 4),
+                                 self.configurations[1].matrix.rms_deviation(
+                                     self.configurations[4].matrix))
+                self.assertRaises(ValueError, view.spectrum, 0, 'ir')
+                self.assertRaises(IndexError, view.distances, 5)
+
+    def test_map(self):
+        with raman.EnsembleStore(self.configurations) as store:
+            expected = [self.configurations[0].matrix.rms_deviation(c.matrix)
+                        for c in self.configurations]
+            self.assertEqual(store.rms_deviations(0, processes=2), expected)
+            self.assertEqual(store.rms_deviations(0, indices=[4, 1], processes=1),
+                             [expected[4], expected[1]])
+
+    def test_mismatched_atoms(self):
+        smaller = raman.DistanceMatrix([[0], [1, 0]])
+        self.configurations.append(raman.Configuration(smaller))
+        self.assertRaises(ValueError, raman.EnsembleStore, self.configurations)
+
+
+class TestClustering(unittest.TestCase):
+    """
+    Tests for clustering Configurations by distance matrix.
+    """
+
+    def setUp(self):
+        matrix = raman.DistanceMatrix.from_csv('test_matrix.csv')
+        # Three well separated groups, interleaved
+        self.configurations = [
+            raman.Configuration(matrix >> (group + 0.01 * member),
+                                raman.Spectrum([100 + group, 200], [1, 2]))
+            for member in range(4) for group in (0, 1, 2)]
+        self.groups = [[0, 3, 6, 9], [1, 4, 7, 10], [2, 5, 8, 11]]
+
+    def test_leader_clustering(self):
+        clustering = raman.clustering.leader_clustering(self.configurations, 0.1)
+        self.assertEqual(clustering.clusters, self.groups)
+        self.assertEqual(clustering.representatives, [0, 1, 2])
+        # Pivot pruning avoids comparing with every leader
+        self.assertTrue(clustering.evaluations < len(self.configurations) * 3)
+
+    def test_k_medoids(self):
+        clustering = raman.clustering.k_medoids(self.configurations, 3)
+        self.assertEqual(clustering.clusters, self.groups)
+        for representative, group in zip(clustering.representatives, self.groups):
+            self.assertIn(representative, group[1:3])
+        self.assertRaises(ValueError, raman.clustering.k_medoids, self.configurations, 13)
+
+    def test_hierarchical_clustering(self):
+        for linkage in ('single', 'complete', 'average'):
+            clustering = raman.clustering.hierarchical_clustering(
+                self.configurations, clusters=3, linkage=linkage)
+            self.assertEqual(clustering.clusters, self.groups)
+        clustering = raman.clustering.hierarchical_clustering(self.configurations, threshold=0.005)
+        self.assertEqual(len(clustering), 12)
+        clustering = raman.clustering.hierarchical_clustering(self.configurations, threshold=0.5)
+        self.assertEqual(clustering.clusters, self.groups)
+        self.assertRaises(ValueError, raman.clustering.hierarchical_clustering, self.configurations)
+
+    def test_average_spectrum(self):
+        clustering = raman.clustering.leader_clustering(self.configurations, 0.1)
+        average = clustering.average_spectrum(1)
+        self.assertEqual(average.frequencies, [101, 200] * 4)
+        self.assertEqual(average.intensities, [0.25, 0.5] * 4)
+        self.assertAlmostEqual(average.fit_function(150),
+                               self.configurations[1].raman_spectrum.fit_function(150))
+        self.assertEqual(len(clustering.average_spectra()), 3)
+
+
+class FakeAxis:
+    """
+    Records the calls made by plotting functions in place of a matplotlib axis.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def plot(self, x_values, y_values, **kwargs):
+        self.calls.append(('plot', list(x_values), list(y_values)))
+        return []
+
+    def fill_between(self, x_values, lower, upper, **kwargs):
+        self.calls.append(('fill_between', list(x_values), list(lower), list(upper)))
+
+
+class TestPlotting(unittest.TestCase):
+    """
+    Tests for downsampled plotting of many spectra.
+    """
+
+    def setUp(self):
+        self.spectra = [raman.Spectrum([100 + i, 200, 300 - i], [1, i, 2]) for i in range(5)]
+        self.x_values = raman.util.linspace(0, 400, 4001)
+        self.y_values = [self.spectra[1].fit_function(x) for x in self.x_values]
+
+    def test_min_max_envelope(self):
+        x_values, y_values = raman.plotting.min_max_envelope(self.x_values, self.y_values, 100)
+        self.assertTrue(len(x_values) <= 200)
+        self.assertEqual(x_values, sorted(x_values))
+        self.assertEqual(max(y_values), max(self.y_values))
+        self.assertEqual(min(y_values), min(self.y_values))
+
+    def test_lttb(self):
+        x_values, y_values = raman.plotting.lttb(self.x_values, self.y_values, 200)
+        self.assertEqual(len(x_values), 200)
+        self.assertEqual((x_values[0], x_values[-1]), (0, 400))
+        self.assertTrue(max(y_values) > 0.95 * max(self.y_values))
+        self.assertRaises(ValueError, raman.plotting.lttb, self.x_values, self.y_values, 2)
+
+    def test_percentile(self):
+        self.assertEqual(raman.plotting.percentile([1, 2, 3, 4, 5], 0.5), 3)
+        self.assertEqual(raman.plotting.percentile([1, 2], 0.25), 1.25)
+        self.assertEqual(raman.plotting.percentile([7], 0.95), 7)
+
+    def test_plot_lines(self):
+        axis = FakeAxis()
+        collection = raman.SpectrumCollection(self.spectra)
+        collection.plot(axis, 0, 400, pixels=50)
+        self.assertEqual(len(axis.calls), 5)
+        self.assertTrue(all(len(call[1]) <= 100 for call in axis.calls))
+
+        # The same range is served from the cache
+        lines = collection._plotter.lines(0, 400, 50)
+        self.assertIs(collection._plotter.lines(0, 400, 50), lines)
+        collection.append(self.spectra[0])
+        self.assertIsNot(collection._plotter.lines(0, 400, 50), lines)
+
+    def test_plot_bands(self):
+        axis = FakeAxis()
+        plotter = raman.plotting.SpectrumPlotter(self.spectra, max_lines=2)
+        plotter.plot(axis, 0, 400, pixels=50)
+        self.assertEqual([call[0] for call in axis.calls], ['plot', 'fill_between', 'fill_between'])
+        _, x_values, median = axis.calls[0]
+        self.assertEqual(len(x_values), 50)
+        for _, _, lower, upper in axis.calls[1:]:
+            self.assertTrue(all(low <= middle <= high
+                                for low, middle, high in zip(lower, median, upper)))
+
 
 
 if __name__ == '__main__':